@@ -0,0 +1,348 @@
+import os
+import json
+import numpy as np
+
+ANN_BACKENDS = ('flat', 'ivf', 'hnsw', 'annoy')
+
+def normalize_rows(matrix):
+    """Return matrix as float32 with unit-length rows; zero rows stay zero"""
+    matrix = np.array(matrix, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+class FaissBackend:
+    """Inner-product faiss index over unit vectors, keyed by store row.
+
+    kind is 'flat' (exact), 'ivf' (nlist cells, nprobe searched) or 'hnsw'
+    (hnsw_m links per node, ef_construction / ef_search beam widths).
+    """
+    supports_add = True
+
+    def __init__(self, kind, dimension, nlist=256, nprobe=8, hnsw_m=32, ef_construction=80, ef_search=64, **params):
+        try:
+            import faiss
+        except ImportError:
+            raise ImportError(f"The '{kind}' ANN backend needs faiss-cpu (see requirements.txt)")
+        self.faiss = faiss
+        self.kind = kind
+        self.dimension = dimension
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.index = None
+
+    def _new_index(self, train_vectors):
+        faiss = self.faiss
+        if self.kind == 'ivf':
+            # faiss wants about 39 training vectors per cell
+            nlist = max(1, min(self.nlist, len(train_vectors) // 39))
+            quantizer = faiss.IndexFlatIP(self.dimension)
+            index = faiss.IndexIVFFlat(quantizer, self.dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+            if len(train_vectors):
+                index.train(train_vectors)
+            return index
+        if self.kind == 'hnsw':
+            inner = faiss.IndexHNSWFlat(self.dimension, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            inner.hnsw.efConstruction = self.ef_construction
+            return faiss.IndexIDMap2(inner)
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimension))
+
+    @property
+    def supports_remove(self):
+        return self.kind != 'hnsw'
+
+    @property
+    def retrain_on_growth(self):
+        # IVF cells are placed for the rows present at training time
+        return self.kind == 'ivf'
+
+    @property
+    def needs_rebuild(self):
+        # An IVF index built over an empty store has no trained cells yet
+        return self.index is None or not self.index.is_trained
+
+    def build(self, rows, vectors):
+        self.index = self._new_index(vectors)
+        self.add(rows, vectors)
+
+    def add(self, rows, vectors):
+        if len(rows):
+            self.index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), np.asarray(rows, dtype=np.int64))
+
+    def remove(self, rows):
+        """Remove rows; returns False if the index type cannot delete"""
+        if not len(rows):
+            return False
+        try:
+            self.index.remove_ids(np.asarray(rows, dtype=np.int64))
+        except RuntimeError:
+            # HNSW cannot delete; removed rows are filtered by the store tombstones instead
+            return False
+        return True
+
+    def search(self, vector, k):
+        if self.index is None or self.index.ntotal == 0:
+            return np.zeros(0, dtype=np.int64)
+        if self.kind == 'ivf':
+            self.index.nprobe = self.nprobe
+        elif self.kind == 'hnsw':
+            self.faiss.downcast_index(self.index.index).hnsw.efSearch = max(self.ef_search, k)
+        _, ids = self.index.search(np.ascontiguousarray(vector, dtype=np.float32).reshape(1, -1), k)
+        ids = ids[0]
+        return ids[ids >= 0]
+
+    def save(self, path):
+        self.faiss.write_index(self.index, path)
+
+    def load(self, path):
+        self.index = self.faiss.read_index(path)
+
+class AnnoyBackend:
+    """Annoy forest over unit vectors (angular distance), keyed by store row.
+
+    n_trees trades build time and size for recall; search_k (-1 for the
+    Annoy default) trades query time for recall. Annoy indexes are
+    immutable once built, so new rows are handled by NoteAnnIndex until the
+    next rebuild.
+    """
+    supports_add = False
+    supports_remove = False
+    needs_rebuild = False
+    retrain_on_growth = False
+
+    def __init__(self, dimension, n_trees=50, search_k=-1, **params):
+        try:
+            from annoy import AnnoyIndex
+        except ImportError:
+            raise ImportError("The 'annoy' ANN backend needs annoy (see requirements.txt)")
+        self.AnnoyIndex = AnnoyIndex
+        self.dimension = dimension
+        self.n_trees = n_trees
+        self.search_k = search_k
+        self.index = None
+
+    def build(self, rows, vectors):
+        self.index = self.AnnoyIndex(self.dimension, 'angular')
+        for row, vector in zip(rows, vectors):
+            self.index.add_item(int(row), vector)
+        self.index.build(self.n_trees)
+
+    def add(self, rows, vectors):
+        raise NotImplementedError("Annoy indexes cannot grow after build")
+
+    def remove(self, rows):
+        # Removed rows are filtered by the store tombstones until the next rebuild
+        return False
+
+    def search(self, vector, k):
+        if self.index is None or self.index.get_n_items() == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.asarray(self.index.get_nns_by_vector(vector, k, search_k=self.search_k), dtype=np.int64)
+
+    def save(self, path):
+        self.index.save(path)
+
+    def load(self, path):
+        self.index = self.AnnoyIndex(self.dimension, 'angular')
+        self.index.load(path)
+
+def make_ann_backend(kind, dimension, **params):
+    if kind == 'annoy':
+        return AnnoyBackend(dimension, **params)
+    if kind in ANN_BACKENDS:
+        return FaissBackend(kind, dimension, **params)
+    raise ValueError(f"Unknown ANN backend '{kind}', expected one of {ANN_BACKENDS}")
+
+class NoteAnnIndex:
+    """Approximate nearest-neighbour indexes over the notes of an EmbeddingStore.
+
+    There is one index for the BERT space and one for the combined RI space
+    (normalised ri_en + ri_te). Index ids are store rows. Rows appended to the
+    store after the last sync are not in the index yet; candidates() returns
+    them as well so they are always scored exactly, and tombstoned rows are
+    filtered out with the store's live mask.
+
+    The indexes are rebuilt automatically once more than rebuild_fraction of
+    their rows (and at least rebuild_min_rows) are unsynced rows a backend
+    cannot add, rows an IVF index was not trained on, or removed rows a
+    backend cannot delete (HNSW, Annoy).
+
+    With read_only, the indexes are only ever loaded from what the indexer
+    saved: while there is no matching saved index, refresh() returns False
+    and the caller scores every note instead.
+    """
+
+    def __init__(self, store, kind, params=None, rebuild_fraction=0.1, rebuild_min_rows=256, read_only=False):
+        self.store = store
+        self.kind = kind
+        self.read_only = read_only
+        self.params = dict(params or {})
+        # Backends that cannot grow are rebuilt once this many rows are unsynced
+        self.rebuild_fraction = rebuild_fraction
+        self.rebuild_min_rows = rebuild_min_rows
+        self.dims = {'bert': store.dims['bert'], 'ri': store.dims['ri_en']}
+        self.backends = {space: make_ann_backend(kind, dim, **self.params) for space, dim in self.dims.items()}
+        self.synced_rows = 0
+        # Live rows at the last build
+        self.trained_rows = 0
+        self.generation = None
+        self.serial = 0
+        self._meta_mtime = None
+        if not self.load() and not read_only:
+            self.rebuild()
+
+    def _path(self, filename):
+        return os.path.join(self.store.directory, filename)
+
+    def _meta_path(self):
+        return self._path(f"ann_{self.kind}.json")
+
+    def _index_path(self, space, serial):
+        # Each save writes new files, so meta.json never names half-written ones
+        if serial is None:
+            return self._path(f"ann_{self.kind}_{space}.index")
+        return self._path(f"ann_{self.kind}_{space}.{serial}.index")
+
+    def _over_threshold(self, rows, base):
+        return rows > max(self.rebuild_min_rows, self.rebuild_fraction * base)
+
+    def _space_vectors(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        return {
+            'bert': normalize_rows(self.store.matrix('bert')[rows]),
+            'ri': normalize_rows(np.asarray(self.store.matrix('ri_en')[rows]) + np.asarray(self.store.matrix('ri_te')[rows]))
+        }
+
+    def load(self):
+        """Load the saved indexes if they match the store. Returns False otherwise."""
+        self.store.refresh()
+        try:
+            mtime = os.stat(self._meta_path()).st_mtime_ns
+            with open(self._meta_path(), 'r') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return False
+        if meta['generation'] != self.store.generation or meta['params'] != self.params or meta['synced_rows'] > len(self.store):
+            return False
+        serial = meta.get('serial')
+        try:
+            for space, backend in self.backends.items():
+                backend.load(self._index_path(space, serial))
+        except (OSError, RuntimeError) as e:
+            # The indexer replaced the files after the metadata was read
+            print(f"Error loading {self.kind} ANN index: {str(e)}")
+            return False
+        self.synced_rows = meta['synced_rows']
+        self.trained_rows = meta.get('trained_rows', meta['synced_rows'])
+        self.serial = serial or 0
+        self.generation = meta['generation']
+        self._meta_mtime = mtime
+        return True
+
+    def save(self):
+        """Write the indexes to new files, then switch the metadata to them"""
+        if self.read_only:
+            raise RuntimeError("The ANN index was opened read-only")
+        old_serial = self.serial
+        self.serial += 1
+        for space, backend in self.backends.items():
+            path = self._index_path(space, self.serial)
+            backend.save(path + '.tmp')
+            os.replace(path + '.tmp', path)
+        with open(self._meta_path() + '.tmp', 'w') as f:
+            json.dump({
+                'generation': self.generation,
+                'synced_rows': self.synced_rows,
+                'trained_rows': self.trained_rows,
+                'serial': self.serial,
+                'params': self.params
+            }, f)
+        os.replace(self._meta_path() + '.tmp', self._meta_path())
+        self._meta_mtime = os.stat(self._meta_path()).st_mtime_ns
+        for space in self.backends:
+            for path in (self._index_path(space, old_serial), self._index_path(space, None)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def rebuild(self):
+        """Build both indexes from the live store rows and save them"""
+        self.store.refresh()
+        rows = np.flatnonzero(self.store.live_mask())
+        vectors = self._space_vectors(rows)
+        for space, backend in self.backends.items():
+            backend.build(rows, vectors[space])
+        self.synced_rows = len(self.store)
+        self.trained_rows = len(rows)
+        self.generation = self.store.generation
+        self.save()
+        print(f"Built {self.kind} ANN index over {len(rows)} notes")
+
+    def sync(self):
+        """Index rows appended to the store since the last sync, then save"""
+        self.store.refresh()
+        if self.generation != self.store.generation:
+            self.rebuild()
+            return
+        tail = np.arange(self.synced_rows, len(self.store))
+        tail = tail[self.store.live_mask()[tail]]
+        if not len(tail):
+            return
+        retrain = any(backend.retrain_on_growth for backend in self.backends.values())
+        if any(backend.needs_rebuild for backend in self.backends.values()):
+            self.rebuild()
+        elif retrain and self._over_threshold(int(self.store.live_mask().sum()) - self.trained_rows, self.trained_rows):
+            self.rebuild()
+        elif all(backend.supports_add for backend in self.backends.values()):
+            vectors = self._space_vectors(tail)
+            for space, backend in self.backends.items():
+                backend.add(tail, vectors[space])
+            self.synced_rows = len(self.store)
+            self.save()
+        elif self._over_threshold(len(tail), len(self.store)):
+            self.rebuild()
+
+    def remove(self, rows, save=True):
+        """Drop rows that were replaced or deleted"""
+        rows = [row for row in rows if row < self.synced_rows]
+        if not rows:
+            return
+        removed = [backend.remove(rows) for backend in self.backends.values()]
+        if not all(removed):
+            # Rows a backend keeps still take up search results until the next rebuild
+            if self._over_threshold(self.stale_rows(), self.synced_rows):
+                self.rebuild()
+                return
+        if save and any(removed):
+            self.save()
+
+    def stale_rows(self):
+        """Removed rows still in the index of a backend that cannot delete"""
+        if all(backend.supports_remove for backend in self.backends.values()):
+            return 0
+        self.store.refresh()
+        return int(np.count_nonzero(self.store.tombstones[:self.synced_rows]))
+
+    def refresh(self):
+        """Reload the indexes if another process saved newer ones. Returns False if they are unusable."""
+        self.store.refresh()
+        try:
+            mtime = os.stat(self._meta_path()).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._meta_mtime or self.generation != self.store.generation:
+            return self.load()
+        return True
+
+    def candidates(self, bert_query, ri_query, k):
+        """Store rows of the k nearest notes in each space plus all unsynced rows"""
+        found = [
+            self.backends['bert'].search(bert_query, k),
+            self.backends['ri'].search(ri_query, k) if np.any(ri_query) else np.zeros(0, dtype=np.int64),
+            np.arange(self.synced_rows, len(self.store))
+        ]
+        rows = np.unique(np.concatenate(found))
+        rows = rows[rows < len(self.store)]
+        return rows[self.store.live_mask()[rows]]
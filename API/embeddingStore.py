@@ -0,0 +1,223 @@
+import os
+import json
+import numpy as np
+
+class EmbeddingStore:
+    """Append-only store of float32 embedding matrices keyed by note id.
+
+    Every matrix lives in one contiguous file that is read with np.memmap, so a
+    query maps a handful of files instead of opening three .npy files per note.
+    Directory layout:
+
+        meta.json       matrix names, dimensions and compaction generation
+        <name>.f32      one float32 row per entry, for each matrix
+        ids.txt         note id of every row, one per line
+        tombstones.u8   one byte per row, 1 once the row was replaced or deleted
+
+    Re-indexing a note appends new rows and tombstones the old ones; compact()
+    drops tombstoned rows and bumps the generation, since row numbers change.
+    tombstones.u8 is written last on append, so its size is the number of
+    complete rows.
+    """
+
+    def __init__(self, directory, dims):
+        self.directory = directory
+        self.dims = {name: int(dim) for name, dim in dims.items()}
+        os.makedirs(directory, exist_ok=True)
+        self._check_meta()
+        self.version = None
+        self.refresh()
+
+    @classmethod
+    def open(cls, directory):
+        """Open an existing store with the dimensions it was created with, or return None"""
+        try:
+            with open(os.path.join(directory, 'meta.json'), 'r') as f:
+                dims = json.load(f)['dims']
+        except FileNotFoundError:
+            return None
+        return cls(directory, dims)
+
+    def _path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def _check_meta(self):
+        meta_path = self._path('meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                stored = json.load(f)['dims']
+            if stored != self.dims:
+                raise ValueError(f"Embedding store at '{self.directory}' has dimensions {stored}, expected {self.dims}")
+        else:
+            self._write_meta(0)
+
+    def _write_meta(self, generation):
+        with open(self._path('meta.json.tmp'), 'w') as f:
+            json.dump({'dims': self.dims, 'generation': generation}, f)
+        os.replace(self._path('meta.json.tmp'), self._path('meta.json'))
+
+    def _current_version(self):
+        try:
+            stat = os.stat(self._path('tombstones.u8'))
+            return stat.st_size, stat.st_mtime_ns
+        except FileNotFoundError:
+            return 0, 0
+
+    def refresh(self):
+        """Re-map the files if another writer changed them. Returns True if anything changed."""
+        version = self._current_version()
+        if version == self.version:
+            return False
+        rows = version[0]
+        with open(self._path('meta.json'), 'r') as f:
+            self.generation = json.load(f).get('generation', 0)
+        self.tombstones = np.fromfile(self._path('tombstones.u8'), dtype=np.uint8) if rows else np.zeros(0, dtype=np.uint8)
+        self.tombstones = self.tombstones[:rows]
+        ids = []
+        if rows:
+            with open(self._path('ids.txt'), 'r', encoding='utf-8') as f:
+                ids = f.read().split('\n')[:rows]
+        self.ids = ids
+        self._ids_size = sum(len(note_id.encode('utf-8')) + 1 for note_id in ids)
+        self._rows = {}
+        for row, note_id in enumerate(ids):
+            if not self.tombstones[row]:
+                self._rows.setdefault(note_id, []).append(row)
+        self._matrices = {}
+        self.version = version
+        return True
+
+    def __len__(self):
+        """Number of rows, including tombstoned ones"""
+        return len(self.ids)
+
+    def __contains__(self, note_id):
+        return note_id in self._rows
+
+    def note_ids(self):
+        return list(self._rows)
+
+    def rows_for(self, note_id):
+        return self._rows.get(note_id, [])
+
+    def live_mask(self):
+        return self.tombstones == 0
+
+    def matrix(self, name):
+        """Read-only (rows, dim) memmap of matrix name"""
+        if name not in self._matrices:
+            dim = self.dims[name]
+            if len(self):
+                self._matrices[name] = np.memmap(self._path(f"{name}.f32"), dtype=np.float32, mode='r', shape=(len(self), dim))
+            else:
+                self._matrices[name] = np.zeros((0, dim), dtype=np.float32)
+        return self._matrices[name]
+
+    def put(self, note_id, vectors):
+        """Store vectors for note_id, replacing whatever it had before"""
+        return self.put_many([(note_id, vectors)])[0]
+
+    def put_many(self, items):
+        """Append (note_id, {name: array}) items in one write per file.
+
+        Each array may be a single vector or an (n, dim) block; all arrays of one
+        item must have the same number of rows. Returns the new rows per item.
+        """
+        self.refresh()
+        # A note listed twice keeps only its last vectors
+        latest = dict(items)
+        items = [(note_id, vectors) for note_id, vectors in items if latest[note_id] is vectors]
+        start = len(self)
+        blocks = {name: [] for name in self.dims}
+        ids = []
+        new_rows = []
+        for note_id, vectors in items:
+            count = None
+            for name, dim in self.dims.items():
+                block = np.asarray(vectors[name], dtype=np.float32).reshape(-1, dim)
+                if count is not None and len(block) != count:
+                    raise ValueError(f"Matrix '{name}' for '{note_id}' has {len(block)} rows, expected {count}")
+                count = len(block)
+                blocks[name].append(block)
+            new_rows.append(list(range(start + len(ids), start + len(ids) + count)))
+            ids.extend([note_id] * count)
+        if not ids:
+            return new_rows
+
+        # Tombstone the rows being replaced before the new ones become visible
+        self._tombstone([row for note_id, _ in items for row in self.rows_for(note_id)])
+        for name, dim in self.dims.items():
+            self._append(f"{name}.f32", np.concatenate(blocks[name]).tobytes(), start * dim * 4)
+        self._append('ids.txt', ''.join(f"{note_id}\n" for note_id in ids).encode('utf-8'), self._ids_size)
+        self._append('tombstones.u8', bytes(len(ids)), start)
+        self.refresh()
+        return new_rows
+
+    def _append(self, filename, data, offset):
+        # Writing at the expected offset (and truncating) discards partial rows left by an interrupted append
+        path = self._path(filename)
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+            f.seek(offset)
+            f.write(data)
+            f.truncate()
+
+    def _tombstone(self, rows):
+        if not rows:
+            return
+        with open(self._path('tombstones.u8'), 'r+b') as f:
+            for row in rows:
+                f.seek(row)
+                f.write(b'\x01')
+
+    def delete(self, note_id):
+        """Tombstone every row of note_id. Returns False if it was not stored."""
+        self.refresh()
+        rows = self.rows_for(note_id)
+        if not rows:
+            return False
+        self._tombstone(rows)
+        self.refresh()
+        return True
+
+    def compact(self):
+        """Rewrite the store without tombstoned rows. Row numbers change."""
+        self.refresh()
+        live = np.flatnonzero(self.live_mask())
+        if len(live) == len(self):
+            return False
+        self._write_meta(self.generation + 1)
+        for name in self.dims:
+            data = np.ascontiguousarray(self.matrix(name)[live])
+            tmp_path = self._path(f"{name}.f32.tmp")
+            data.tofile(tmp_path)
+            os.replace(tmp_path, self._path(f"{name}.f32"))
+        self._matrices = {}
+        with open(self._path('ids.txt.tmp'), 'w', encoding='utf-8') as f:
+            f.write(''.join(f"{self.ids[row]}\n" for row in live))
+        os.replace(self._path('ids.txt.tmp'), self._path('ids.txt'))
+        np.zeros(len(live), dtype=np.uint8).tofile(self._path('tombstones.u8.tmp'))
+        os.replace(self._path('tombstones.u8.tmp'), self._path('tombstones.u8'))
+        self.refresh()
+        return True
+
+def import_legacy_embeddings(store, notes_directory, embeddings_directory, vec_en_dir, vec_te_dir):
+    """Copy per-note {name}_bert.npy / {name}_ri.npy files into an empty store"""
+    if len(store) or not os.path.isdir(notes_directory):
+        return 0
+    items = []
+    for filename in sorted(os.listdir(notes_directory)):
+        if not filename.endswith('.txt'):
+            continue
+        doc_name = filename[:-len('.txt')]
+        bert_path = os.path.join(embeddings_directory, f"{doc_name}_bert.npy")
+        if not os.path.exists(bert_path):
+            continue
+        vectors = {'bert': np.load(bert_path)}
+        for name, directory in [('ri_en', vec_en_dir), ('ri_te', vec_te_dir)]:
+            path = os.path.join(directory, f"{doc_name}_ri.npy")
+            vectors[name] = np.load(path) if os.path.exists(path) else np.zeros(store.dims[name])
+        items.append((doc_name, vectors))
+    store.put_many(items)
+    if items:
+        print(f"Imported {len(items)} legacy embeddings into {store.directory}")
+    return len(items)
@@ -0,0 +1,135 @@
+import threading
+import numpy as np
+
+MODEL_NAME = 'bert-base-multilingual-cased'
+
+class BertEncoder:
+    """BERT tokenizer and model shared by the indexer and the retriever.
+
+    Nothing is imported or loaded until the first call to encode(), so
+    commands that never embed text do not pay for torch or the model.
+    """
+
+    def __init__(self, model_name=MODEL_NAME):
+        self.model_name = model_name
+        self._tokenizer = None
+        self._model = None
+        self._device = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is not None:
+                return
+            import torch
+            from transformers import BertTokenizer, BertModel
+            print(f"Loading {self.model_name}...")
+            self._tokenizer = BertTokenizer.from_pretrained(self.model_name)
+            model = BertModel.from_pretrained(self.model_name)
+            self._device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+            model.to(self._device)
+            model.eval()
+            self._model = model
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    @property
+    def tokenizer(self):
+        self._load()
+        return self._tokenizer
+
+    @property
+    def model(self):
+        self._load()
+        return self._model
+
+    @property
+    def device(self):
+        self._load()
+        return self._device
+
+    def encode(self, texts, max_length=512):
+        """pooler_output for a batch of texts, one padded forward pass, as a float32 (n, 768) array"""
+        import torch
+        inputs = self.tokenizer(
+            list(texts),
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=max_length
+        ).to(self.device)
+
+        with torch.no_grad():
+            outputs = self.model(**inputs)
+            # Use pooler_output for consistent dimensionality
+            return outputs.pooler_output.cpu().numpy().astype(np.float32)
+
+    def _windows(self, text, max_length, overlap):
+        """Token ids of text split into windows of at most max_length - 2 tokens"""
+        ids = self.tokenizer.encode(text, add_special_tokens=False, verbose=False)
+        body = max_length - 2
+        step = max(1, body - overlap)
+        windows = [ids[start:start + body] for start in range(0, max(1, len(ids) - overlap), step)]
+        return windows or [[]]
+
+    def encode_documents(self, texts, max_length=512, overlap=128, pooling='mean', batch_size=32, return_chunks=False):
+        """Embed documents of any length.
+
+        Each text is split into windows of max_length tokens (including [CLS]
+        and [SEP]) that overlap by overlap tokens. The windows of all texts are
+        encoded together in padded batches of batch_size, and each document's
+        window vectors are pooled with 'mean' or 'max'. A text that fits in one
+        window gets exactly the vector encode() would give it.
+
+        Returns a float32 (n, 768) array, plus a list with each document's
+        (windows, 768) array when return_chunks is set.
+        """
+        import torch
+        if pooling not in ('mean', 'max'):
+            raise ValueError(f"Unknown pooling '{pooling}', expected 'mean' or 'max'")
+        tokenizer = self.tokenizer
+
+        windows = []
+        counts = []
+        for text in texts:
+            text_windows = self._windows(text, max_length, overlap)
+            windows.extend([tokenizer.cls_token_id] + ids + [tokenizer.sep_token_id] for ids in text_windows)
+            counts.append(len(text_windows))
+
+        vectors = np.zeros((len(windows), self.model.config.hidden_size), dtype=np.float32)
+        # Windows of similar length share a batch, so little of each batch is padding
+        order = sorted(range(len(windows)), key=lambda i: len(windows[i]))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            width = max(len(windows[i]) for i in batch)
+            input_ids = torch.full((len(batch), width), tokenizer.pad_token_id, dtype=torch.long)
+            attention_mask = torch.zeros((len(batch), width), dtype=torch.long)
+            for row, i in enumerate(batch):
+                input_ids[row, :len(windows[i])] = torch.tensor(windows[i], dtype=torch.long)
+                attention_mask[row, :len(windows[i])] = 1
+            with torch.no_grad():
+                outputs = self.model(input_ids=input_ids.to(self.device), attention_mask=attention_mask.to(self.device))
+            vectors[batch] = outputs.pooler_output.cpu().numpy()
+
+        chunks = np.split(vectors, np.cumsum(counts)[:-1]) if counts else []
+        pool = np.mean if pooling == 'mean' else np.max
+        pooled = np.stack([pool(doc_chunks, axis=0) for doc_chunks in chunks]) if chunks else vectors
+        if return_chunks:
+            return pooled, chunks
+        return pooled
+
+    def passage(self, text, chunk, max_length=512, overlap=128):
+        """Text of window number chunk of text, as split by encode_documents"""
+        return self.tokenizer.decode(self._windows(text, max_length, overlap)[chunk])
+
+_encoders = {}
+_encoders_lock = threading.Lock()
+
+def get_encoder(model_name=MODEL_NAME):
+    """Return the process-wide encoder for model_name, creating it (unloaded) on first request"""
+    with _encoders_lock:
+        if model_name not in _encoders:
+            _encoders[model_name] = BertEncoder(model_name)
+        return _encoders[model_name]
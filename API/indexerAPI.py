@@ -1,18 +1,50 @@
 import os
-import torch
+import json
+import shutil
+import threading
 import numpy as np
+import scipy.sparse as sp
+from collections import Counter
 from dotenv import load_dotenv
-from transformers import BertTokenizer, BertModel
-from ri import dsm, make_index, weight_func, remove_centroid
+from ri import hashed_index, SVDProjection
+from encoder import get_encoder
+from embeddingStore import EmbeddingStore, import_legacy_embeddings
+from annIndex import NoteAnnIndex, normalize_rows
+from vocabStore import VocabularyStore, import_legacy_vocabulary
+from indexingQueue import IndexingQueue
+from lexicalIndex import LexicalIndex, import_notes
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), 'inputProcesser'))
-from TenglishFormatter import process_user_input
+from TenglishFormatter import process_user_input, process_user_inputs
 
 load_dotenv()
 
 class IndexerAPI:
-    def __init__(self, dimension=300, nonzeros=8, delta=60):
-        """Initialize the indexer with both BERT and Random Indexing"""
+    def __init__(self, dimension=300, nonzeros=8, delta=60, ann_backend=None, ann_params=None,
+                 chunk_overlap=128, chunk_pooling='mean', keep_chunks=False, ri_seed=0,
+                 async_indexing=False, queue_batch_size=16, queue_delay=0.0):
+        """Initialize the indexer with both BERT and Random Indexing
+
+        ann_backend ('flat', 'ivf', 'hnsw' or 'annoy', default $ANN_BACKEND)
+        keeps an approximate nearest-neighbour index up to date for RetrievalAPI;
+        ann_params (default $ANN_PARAMS, a JSON object) holds its tuning knobs.
+
+        Notes longer than 512 tokens are embedded as overlapping windows
+        (chunk_overlap tokens shared between neighbours) pooled with
+        chunk_pooling ('mean' or 'max'). With keep_chunks the window vectors
+        are also stored for RetrievalAPI.find_passages.
+
+        A note's RI document index is hashed from its name and ri_seed, so
+        re-indexing a note reuses the same index. The words of every indexed
+        note are remembered, and re-indexing applies only the occurrences that
+        were added or removed to the word vectors.
+
+        With async_indexing, editNote only saves the text and queues the note;
+        a background thread embeds queued notes in batches of queue_batch_size,
+        waiting up to queue_delay seconds for more edits first; notes of a
+        failed batch are retried. Use flush() or wait() before reading the
+        embeddings, and queue_stats() to monitor it.
+        """
         self.NOTES_DIRECTORY = os.getenv("NOTES_DIRECTORY")
         self.EMBEDDINGS_DIRECTORY = os.getenv("EMBEDDINGS_DIRECTORY")
         
@@ -23,25 +55,57 @@ class IndexerAPI:
         for directory in [self.NOTES_DIRECTORY, self.EMBEDDINGS_DIRECTORY, self.VEC_EN_DIR, self.VEC_TE_DIR]:
             os.makedirs(directory, exist_ok=True)
         
-        # BERT initialization
-        self.tokenizer = BertTokenizer.from_pretrained('bert-base-multilingual-cased')
-        self.model = BertModel.from_pretrained('bert-base-multilingual-cased')
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.model.to(self.device)
+        # Shared BERT encoder, loaded on first use
+        self.encoder = get_encoder()
         
         # Random Indexing parameters
         self.dimension = dimension
         self.nonzeros = nonzeros
         self.delta = delta
-        self.en_vocab = {}
-        self.te_vocab = {}
-        self.en_vectors = []
-        self.te_vectors = []
+        self.ri_seed = ri_seed
         self.bert_dimension = 768  # Add this line
         self.ri_dimension = dimension
+        self.chunk_overlap = chunk_overlap
+        self.chunk_pooling = chunk_pooling
         
         self._load_vocabularies()
 
+        # Optional ANN index, updated after every write to the store
+        self.ann_backend = ann_backend or os.getenv("ANN_BACKEND")
+        self.ann_params = json.loads(os.getenv("ANN_PARAMS", "{}")) if ann_params is None else ann_params
+
+        # All note embeddings live in one memory-mapped store, RI vectors
+        # reduced by the store's RI projection if it has one
+        self.STORE_DIRECTORY = os.path.join(self.EMBEDDINGS_DIRECTORY, "store")
+        self.RI_PROJECTION_PATH = os.path.join(self.STORE_DIRECTORY, "ri_projection.npz")
+        self._open_store()
+        if self.ri_projection is None:
+            import_legacy_embeddings(self.store, self.NOTES_DIRECTORY, self.EMBEDDINGS_DIRECTORY, self.VEC_EN_DIR, self.VEC_TE_DIR)
+
+        # Optional per-window BERT vectors, several rows per note
+        self.CHUNK_STORE_DIRECTORY = os.path.join(self.EMBEDDINGS_DIRECTORY, "chunks")
+        self.chunk_store = EmbeddingStore(self.CHUNK_STORE_DIRECTORY, {'bert': self.bert_dimension}) if keep_chunks else None
+
+        # BM25 inverted index of the note text for RetrievalAPI
+        self.LEXICAL_DIRECTORY = os.path.join(self.EMBEDDINGS_DIRECTORY, "lexical")
+        self.lexical = LexicalIndex(self.LEXICAL_DIRECTORY)
+        import_notes(self.lexical, self.store.note_ids(), self.NOTES_DIRECTORY)
+
+        # Held while the store and vocabularies are written, by callers and the queue worker
+        self._lock = threading.RLock()
+        self.queue = IndexingQueue(self, queue_batch_size, queue_delay) if async_indexing else None
+
+    def _open_store(self):
+        """Open the embedding store, its RI projection and the ANN index"""
+        self.ri_projection = SVDProjection.load(self.RI_PROJECTION_PATH) if os.path.exists(self.RI_PROJECTION_PATH) else None
+        ri_store_dimension = self.ri_projection.dim if self.ri_projection else self.ri_dimension
+        self.store = EmbeddingStore(self.STORE_DIRECTORY, {
+            'bert': self.bert_dimension,
+            'ri_en': ri_store_dimension,
+            'ri_te': ri_store_dimension
+        })
+        self.ann = NoteAnnIndex(self.store, self.ann_backend, self.ann_params) if self.ann_backend else None
+
     def createNote(self, fileName):
         """Create a new note file"""
         file_path = os.path.join(self.NOTES_DIRECTORY, f"{fileName}.txt")
@@ -56,171 +120,402 @@ class IndexerAPI:
         file_path = os.path.join(self.NOTES_DIRECTORY, f"{fileName}.txt")
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"The file '{fileName}.txt' does not exist.")
-            
+
+        if self.queue is not None:
+            # Keep the raw text until the queue worker processes and embeds it
+            with self.queue.lock:
+                with open(file_path, 'w', encoding='utf-8') as file:
+                    file.write(inputText)
+                self.queue.put(fileName, inputText)
+            return
+
         processed_text = process_user_input(inputText)
         with open(file_path, 'w', encoding='utf-8') as file:
             file.write(processed_text)
 
         # Update embeddings
-        self._update_embeddings(fileName, processed_text)
+        with self._lock:
+            self._update_embeddings(fileName, processed_text)
+
+    def flush(self, timeout=None):
+        """Embed queued edits now and wait for them.
+
+        Returns False on timeout or if the queue gave up on an edit after
+        retrying it; queue_stats() lists those notes under 'failed'.
+        """
+        return self.queue.flush(timeout) if self.queue is not None else True
+
+    def wait(self, timeout=None):
+        """Wait until the queue worker has embedded every queued edit. Returns False like flush()."""
+        return self.queue.wait(timeout) if self.queue is not None else True
+
+    def queue_stats(self):
+        """Queue depth and counters of the background indexer, None without async_indexing"""
+        return self.queue.stats() if self.queue is not None else None
+
+    def _index_queued(self, items):
+        """Process, save and embed (fileName, raw text) items taken from the queue"""
+        with self._lock:
+            # Notes deleted since they were queued are skipped
+            items = [(fileName, text) for fileName, text in items
+                     if os.path.exists(os.path.join(self.NOTES_DIRECTORY, f"{fileName}.txt"))]
+            if not items:
+                return
+            fileNames = [fileName for fileName, _ in items]
+            texts = process_user_inputs([text for _, text in items])
+            with self.queue.lock:
+                for fileName, text in zip(fileNames, texts):
+                    # A newer edit waiting in the queue keeps its raw text
+                    if fileName not in self.queue:
+                        with open(os.path.join(self.NOTES_DIRECTORY, f"{fileName}.txt"), 'w', encoding='utf-8') as file:
+                            file.write(text)
+            self._flush(self._index_documents(fileNames, texts))
+
+    def deleteNote(self, fileName):
+        """Delete a note and its embeddings. Returns False if neither existed."""
+        with self._lock:
+            if self.queue is not None:
+                self.queue.discard(fileName)
+            file_path = os.path.join(self.NOTES_DIRECTORY, f"{fileName}.txt")
+            deleted = False
+            if os.path.exists(file_path):
+                os.remove(file_path)
+                deleted = True
+            # Take the note's occurrences back out of the word vectors
+            for language in ('en', 'te'):
+                self._update_notes_ri([fileName], language, [[]])
+            self._save_vocabularies()
+            rows = self.store.rows_for(fileName)
+            if self.store.delete(fileName):
+                deleted = True
+                if self.ann:
+                    self.ann.remove(rows)
+            if self.chunk_store is not None:
+                self.chunk_store.delete(fileName)
+            self.lexical.delete(fileName)
+            return deleted
+
+    def rebuild_index(self):
+        """Drop deleted and replaced rows from the store and rebuild the ANN index"""
+        with self._lock:
+            self.store.compact()
+            if self.chunk_store is not None:
+                self.chunk_store.compact()
+            self.lexical.compact()
+            if self.ann:
+                self.ann.rebuild()
+
+    def reduce_ri(self, dim=256, **params):
+        """Keep RI document vectors in dim dimensions, or at full size again with dim=None.
+
+        Fits an SVDProjection (params go to SVDProjection.fit) on the English
+        and Telugu word vectors, projects the stored document vectors and
+        rewrites the store with it. Vectors that were already projected are
+        mapped back through the old projection first, which is approximate;
+        bulk_index the notes again for exact vectors.
+        """
+        with self._lock:
+            projection = None
+            if dim:
+                models = [vocab.matrix() for vocab in (self.en_vocab, self.te_vocab) if len(vocab)]
+                projection = SVDProjection.fit(models, dim, **params)
+
+            self.store.refresh()
+            live = np.flatnonzero(self.store.live_mask())
+            ri_matrices = {}
+            for name in ('ri_en', 'ri_te'):
+                matrix = np.asarray(self.store.matrix(name)[live], dtype=np.float32)
+                if self.ri_projection is not None:
+                    matrix = matrix @ self.ri_projection.components.T
+                if projection is not None:
+                    matrix = projection.project(matrix)
+                ri_matrices[name] = normalize_rows(matrix)
+            ri_store_dimension = projection.dim if projection else self.ri_dimension
+
+            # Write the new store next to the old one, then swap the directories
+            new_directory = self.STORE_DIRECTORY + ".new"
+            old_directory = self.STORE_DIRECTORY + ".old"
+            shutil.rmtree(new_directory, ignore_errors=True)
+            new_store = EmbeddingStore(new_directory, {
+                'bert': self.bert_dimension,
+                'ri_en': ri_store_dimension,
+                'ri_te': ri_store_dimension
+            })
+            bert_matrix = self.store.matrix('bert')
+            new_store.put_many([
+                (self.store.ids[row], {
+                    'bert': bert_matrix[row],
+                    'ri_en': ri_matrices['ri_en'][i],
+                    'ri_te': ri_matrices['ri_te'][i]
+                })
+                for i, row in enumerate(live)
+            ])
+            if projection is not None:
+                projection.save(os.path.join(new_directory, "ri_projection.npz"))
+            shutil.rmtree(old_directory, ignore_errors=True)
+            os.rename(self.STORE_DIRECTORY, old_directory)
+            os.rename(new_directory, self.STORE_DIRECTORY)
+            shutil.rmtree(old_directory)
+            self._open_store()
+            print(f"Stored RI vectors of {len(live)} notes in {ri_store_dimension} dimensions")
+
+    def bulk_index(self, paths_or_texts, batch_size=16, checkpoint_every=1000, preprocess=True):
+        """Index many notes in one pass.
+
+        paths_or_texts may mix directories (every .txt file inside is indexed),
+        paths to .txt files and (fileName, text) pairs. Each note is written to
+        NOTES_DIRECTORY like editNote does, BERT runs on padded batches of
+        batch_size notes, and embeddings and vocabularies are flushed every
+        checkpoint_every notes and once at the end instead of after every note.
+        Set preprocess=False for texts that already went through process_user_input.
+        """
+        with self._lock:
+            indexed = []
+            pending = []
+            batch = []
+
+            def run_batch():
+                fileNames = [name for name, _ in batch]
+                texts = [text for _, text in batch]
+                if preprocess:
+                    texts = process_user_inputs(texts)
+                for fileName, text in zip(fileNames, texts):
+                    file_path = os.path.join(self.NOTES_DIRECTORY, f"{fileName}.txt")
+                    with open(file_path, 'w', encoding='utf-8') as file:
+                        file.write(text)
+                pending.extend(self._index_documents(fileNames, texts))
+                indexed.extend(fileNames)
+                batch.clear()
+
+            for fileName, text in self._iter_bulk_notes(paths_or_texts):
+                batch.append((fileName, text))
+                if len(batch) >= batch_size:
+                    run_batch()
+                if checkpoint_every and len(pending) >= checkpoint_every:
+                    self._flush(pending)
+            if batch:
+                run_batch()
+            self._flush(pending)
+
+            print(f"Bulk indexed {len(indexed)} notes")
+            return indexed
+
+    def _iter_bulk_notes(self, paths_or_texts):
+        """Yield (fileName, text) for every item accepted by bulk_index"""
+        for item in paths_or_texts:
+            if isinstance(item, tuple):
+                yield item
+            elif os.path.isdir(item):
+                for filename in sorted(os.listdir(item)):
+                    if filename.endswith('.txt'):
+                        yield from self._iter_bulk_notes([os.path.join(item, filename)])
+            else:
+                with open(item, 'r', encoding='utf-8') as file:
+                    yield os.path.splitext(os.path.basename(item))[0], file.read()
 
     def _update_embeddings(self, fileName, text):
         try:
-            # BERT embedding
-            bert_embedding = self._compute_bert_embedding(text)
-            bert_path = os.path.join(self.EMBEDDINGS_DIRECTORY, f"{fileName}_bert.npy")
-            np.save(bert_path, bert_embedding)
-            print(f"Saved BERT embedding with shape: {bert_embedding.shape}")
-
-            # Split languages
-            en_words, te_words = self._split_languages(text)
-            
-            # Compute and save English RI embedding
-            if en_words:
-                en_embedding = self._compute_ri_embedding_for_language(en_words, self.en_vocab, self.en_vectors)
-                en_path = os.path.join(self.VEC_EN_DIR, f"{fileName}_ri.npy")
-                np.save(en_path, en_embedding)
-                print(f"Saved English RI embedding with shape: {en_embedding.shape}")
-            
-            # Compute and save Telugu RI embedding
-            if te_words:
-                te_embedding = self._compute_ri_embedding_for_language(te_words, self.te_vocab, self.te_vectors)
-                te_path = os.path.join(self.VEC_TE_DIR, f"{fileName}_ri.npy")
-                np.save(te_path, te_embedding)
-                print(f"Saved Telugu RI embedding with shape: {te_embedding.shape}")
-            
-            # Save vocabularies
-            self._save_vocabularies()
-            
+            self._flush(self._index_documents([fileName], [text]))
         except Exception as e:
             print(f"Error updating embeddings: {str(e)}")
             raise
-        
-        
+
+    def _index_documents(self, fileNames, texts):
+        """Compute BERT and RI embeddings for a batch of notes.
+
+        Returns a list of (fileName, embeddings) pairs for _flush; RI word
+        vectors are updated in memory only. A note without English or Telugu
+        words has no 'en' or 'te' entry, 'chunks' holds the window vectors
+        when they are kept and 'text' the text for the lexical index.
+        """
+        bert_embeddings, chunk_embeddings = self._compute_bert_embeddings(texts, return_chunks=True)
+        results = []
+        for fileName, text, bert_embedding, chunks in zip(fileNames, texts, bert_embeddings, chunk_embeddings):
+            embeddings = {'bert': bert_embedding.reshape(1, self.bert_dimension), 'text': text}
+            if self.chunk_store is not None:
+                embeddings['chunks'] = chunks
+
+            results.append((fileName, embeddings))
+
+        # Split languages, then update the RI vectors of all notes per language
+        words = [self._split_languages(text) for text in texts]
+        for column, language in enumerate(['en', 'te']):
+            ri_embeddings = self._update_notes_ri(fileNames, language, [note_words[column] for note_words in words])
+            for (fileName, embeddings), embedding in zip(results, ri_embeddings):
+                if embedding is not None:
+                    embeddings[language] = embedding
+        return results
+
+    def _flush(self, results):
+        """Write embeddings computed by _index_documents, then the vocabularies"""
+        replaced_rows = [row for fileName, _ in results for row in self.store.rows_for(fileName)]
+        self.store.put_many([
+            (fileName, {
+                'bert': embeddings['bert'],
+                'ri_en': self._project_ri(embeddings.get('en', np.zeros(self.ri_dimension))),
+                'ri_te': self._project_ri(embeddings.get('te', np.zeros(self.ri_dimension)))
+            })
+            for fileName, embeddings in results
+        ])
+        if self.chunk_store is not None:
+            self.chunk_store.put_many([
+                (fileName, {'bert': embeddings['chunks']})
+                for fileName, embeddings in results if 'chunks' in embeddings
+            ])
+        self.lexical.put_many([(fileName, embeddings['text']) for fileName, embeddings in results])
+        print(f"Saved embeddings for {len(results)} notes to {self.STORE_DIRECTORY}")
+        results.clear()
+        if self.ann:
+            self.ann.remove(replaced_rows, save=False)
+            self.ann.sync()
+
+        # Save vocabularies
+        self._save_vocabularies()
+
+    def _project_ri(self, vectors):
+        """RI vectors in the store's space, renormalised after projection"""
+        if self.ri_projection is None:
+            return vectors
+        return normalize_rows(self.ri_projection.project(vectors))
+
     def _compute_bert_embedding(self, text):
-        inputs = self.tokenizer(
-            text,
-            return_tensors="pt",
-            padding=True,
-            truncation=True,
-            max_length=512
-        ).to(self.device)
-        
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            # Use pooler_output for consistent dimensionality
-            embedding = outputs.pooler_output.cpu().numpy()
-            
-            # Handle NaN values
-            embedding = np.nan_to_num(embedding, nan=0.0)
-            
-            # Normalize the embedding
-            norm = np.linalg.norm(embedding)
-            if norm > 0:
-                embedding = embedding / norm
-                
-            return embedding.reshape(1, self.bert_dimension)
+        return self._compute_bert_embeddings([text]).reshape(1, self.bert_dimension)
+
+    def _compute_bert_embeddings(self, texts, return_chunks=False):
+        """Embed a batch of texts of any length; returns normalised rows.
+
+        With return_chunks, also returns each text's normalised window vectors.
+        """
+        embeddings, chunks = self.encoder.encode_documents(
+            texts,
+            overlap=self.chunk_overlap,
+            pooling=self.chunk_pooling,
+            return_chunks=True
+        )
+
+        # Handle NaN values and normalize the embeddings
+        embeddings = normalize_rows(np.nan_to_num(embeddings, nan=0.0)).reshape(-1, self.bert_dimension)
+        if return_chunks:
+            return embeddings, [normalize_rows(np.nan_to_num(chunk, nan=0.0)) for chunk in chunks]
+        return embeddings
         
     def _split_languages(self, text):
         """Split text into English and Telugu words"""
         words = text.split()
-        en_words = [w.lower() for w in words if all(ord(c) < 128 for c in w)]
-        te_words = [w for w in words if not all(ord(c) < 128 for c in w)]
+        en_words = [w.lower() for w in words if w.isascii()]
+        te_words = [w for w in words if not w.isascii()]
         return en_words, te_words
 
-    def _compute_ri_embedding(self, text):
-        """Compute combined RI embedding for query processing"""
-        if isinstance(text, str):
-            words = text.split()
-        else:
-            words = text if isinstance(text, list) else []
-            
-        if not words:
-            return np.zeros((1, self.ri_dimension))
-        
-        # Split into languages
-        en_words = [w.lower() for w in words if all(ord(c) < 128 for c in w)]
-        te_words = [w for w in words if not all(ord(c) < 128 for c in w)]
-        
-        # Compute embeddings for each language
-        en_vector = np.zeros(self.ri_dimension)
-        te_vector = np.zeros(self.ri_dimension)
-        
-        if en_words:
-            en_vector = self._compute_ri_embedding_for_language(en_words, self.en_vocab, self.en_vectors)[0]
-        if te_words:
-            te_vector = self._compute_ri_embedding_for_language(te_words, self.te_vocab, self.te_vectors)[0]
-        
-        # Combine vectors
-        combined_vector = en_vector + te_vector
-        if np.any(combined_vector):
-            combined_vector = combined_vector / np.linalg.norm(combined_vector)
-        
-        return combined_vector.reshape(1, self.ri_dimension)
-    
-    def _compute_ri_embedding_for_language(self, words, vocab, vectors):
-        """Compute RI embedding for a specific language"""
-        if not words:
-            return np.zeros((1, self.ri_dimension))
-        
-        # Create document vector using Random Indexing
-        doc_vector = make_index(self.dimension, self.nonzeros)
-        word_count = 0
-        
-        # Create word vector
-        word_vector = np.zeros(self.ri_dimension)
-        
-        for word in words:
-            if word not in vocab:
-                # Add new word to vocabulary
-                vocab[word] = [len(vectors), 1]
-                vectors.append(np.zeros(self.dimension))
-            else:
-                vocab[word][1] += 1
-            
-            # Update word vector
-            idx = vocab[word][0]
-            weight = weight_func(vocab[word][1], len(vocab), self.delta)
-            np.add.at(vectors[idx], doc_vector[:,0], doc_vector[:,1] * weight)
-            word_vector += vectors[idx]
-            word_count += 1
-        
-        # Average and normalize
-        if word_count > 0:
-            word_vector = word_vector / word_count
-            norm = np.linalg.norm(word_vector)
-            if norm > 0:
-                word_vector = word_vector / norm
-        
-        print(f"Created RI embedding from {word_count}/{len(words)} words")
-        return word_vector.reshape(1, self.ri_dimension)
-    
+    def _update_notes_ri(self, fileNames, language, word_lists):
+        """Bring the word vectors of language in line with the notes' new words.
+
+        Each note's occurrences and the total weight they added to every word
+        vector are remembered, so only the difference from the last indexing
+        is applied: added occurrences add the note's document index weighed
+        in text order with the word's count and the vocabulary size at that
+        point, as ri.weight_func does; removed ones subtract their share of
+        what was added. Notes are applied in order.
+
+        The RI embeddings, the normalised mean word vector of each note, are
+        then one sparse (notes, words) matrix product with the vectors of the
+        words used. Returns one embedding per note, None if it has no words.
+        """
+        vocab = self.en_vocab if language == 'en' else self.te_vocab
+        indices, signs = hashed_index(fileNames, self.dimension, self.nonzeros, self.ri_seed)
+        changed = 0
+        for fileName, words, index, sign in zip(fileNames, word_lists, indices, signs):
+            old_terms = self._note_terms(language, fileName)
+            counts = Counter(words)
+            # Words in the order they first appear, then the ones that were removed
+            order = list(counts) + [word for word in old_terms if word not in counts]
+            old = np.array([old_terms.get(word, [0, 0.0])[0] for word in order], dtype=np.int64)
+            old_weight = np.array([old_terms.get(word, [0, 0.0])[1] for word in order], dtype=np.float64)
+            new = np.array([counts[word] for word in order], dtype=np.int64)
+            moved = np.flatnonzero(new != old)
+            weight = old_weight.copy()
+            if len(moved):
+                moved_words = [order[k] for k in moved]
+                change = new[moved] - old[moved]
+                # Occurrences past a word's old count are added ones, each weighed with the
+                # word's count and the vocabulary size at its place in the text
+                position = {word: k for k, word in enumerate(order)}
+                token_words = np.array([position[word] for word in words], dtype=np.int64)
+                # 1 for a word's first occurrence in the note, 2 for its second, ...
+                by_word = np.argsort(token_words, kind='stable')
+                sorted_words = token_words[by_word]
+                occurrence = np.empty(len(token_words), dtype=np.int64)
+                occurrence[by_word] = np.arange(len(token_words)) - np.searchsorted(sorted_words, sorted_words) + 1
+                adding = occurrence > old[token_words]
+                known = np.array([vocab.rows.get(word, -1) for word in order], dtype=np.int64)
+                before = np.where(known >= 0, vocab.counts(known), 0)
+                token_counts = before[token_words] + occurrence - old[token_words]
+                new_type = (known[token_words] < 0) & (occurrence == 1)
+                token_types = len(vocab) + np.cumsum(new_type)
+                token_weights = np.exp(-self.delta * token_counts / token_types)
+                added = np.zeros(len(order))
+                np.add.at(added, token_words[adding], token_weights[adding])
+                # Removed occurrences take back their share of what the note added
+                removing = new < old
+                added[removing] = old_weight[removing] * (new[removing] - old[removing]) / old[removing]
+                added = added[moved]
+                rows = vocab.touch_many(moved_words, change)
+                vocab.add_to_rows(rows, np.broadcast_to(index, (len(rows), len(index))), np.outer(added, sign))
+                weight[moved] += added
+                changed += len(moved)
+            self._pending_terms[(language, fileName)] = {
+                word: [n, w] for word, n, w in zip(order, new.tolist(), weight.tolist()) if n
+            }
+
+        notes = [k for k, words in enumerate(word_lists) if words]
+        embeddings = [None] * len(word_lists)
+        if not notes:
+            return embeddings
+        note_counts = [Counter(word_lists[k]) for k in notes]
+        rows = np.array([vocab.rows[word] for counts in note_counts for word in counts], dtype=np.int64)
+        data = np.array([n / len(word_lists[k]) for k, counts in zip(notes, note_counts) for n in counts.values()])
+        indptr = np.concatenate([[0], np.cumsum([len(counts) for counts in note_counts])])
+        used, columns = np.unique(rows, return_inverse=True)
+        doc_term = sp.csr_matrix((data, columns, indptr), shape=(len(notes), len(used)))
+        doc_vectors = normalize_rows(doc_term @ vocab.vectors(used).astype(np.float64))
+        for k, vector in zip(notes, doc_vectors):
+            embeddings[k] = vector.reshape(1, self.ri_dimension)
+        print(f"Updated {changed} {language} word vectors and the RI embeddings of {len(notes)} notes")
+        return embeddings
+
+    def _note_terms_path(self, language, fileName):
+        directory = self.VEC_EN_DIR if language == 'en' else self.VEC_TE_DIR
+        return os.path.join(directory, "note_terms", f"{fileName}.json")
+
+    def _note_terms(self, language, fileName):
+        """{word: [occurrences, weight]} of the note as last indexed"""
+        if (language, fileName) in self._pending_terms:
+            return self._pending_terms[(language, fileName)]
+        try:
+            with open(self._note_terms_path(language, fileName), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
     def _save_vocabularies(self):
-        """Save vocabularies and vectors"""
-        # Save English vocabulary and vectors
-        en_path = os.path.join(self.VEC_EN_DIR, "vocab.npz")
-        np.savez(en_path,
-                vocab=self.en_vocab,
-                vectors=self.en_vectors)
-        
-        # Save Telugu vocabulary and vectors
-        te_path = os.path.join(self.VEC_TE_DIR, "vocab.npz")
-        np.savez(te_path,
-                vocab=self.te_vocab,
-                vectors=self.te_vectors)
-        
+        """Save the words touched since the last save, then the notes' words"""
+        self.en_vocab.save()
+        self.te_vocab.save()
+        for (language, fileName), terms in self._pending_terms.items():
+            path = self._note_terms_path(language, fileName)
+            if not terms:
+                if os.path.exists(path):
+                    os.remove(path)
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(terms, f, ensure_ascii=False)
+            os.replace(path + '.tmp', path)
+        self._pending_terms.clear()
+
     def _load_vocabularies(self):
-        """Load existing vocabularies"""
-        # Load English vocabulary and vectors
-        en_path = os.path.join(self.VEC_EN_DIR, "vocab.npz")
-        if os.path.exists(en_path):
-            data = np.load(en_path, allow_pickle=True)
-            self.en_vocab = data['vocab'].item()
-            self.en_vectors = data['vectors']
-        
-        # Load Telugu vocabulary and vectors
-        te_path = os.path.join(self.VEC_TE_DIR, "vocab.npz")
-        if os.path.exists(te_path):
-            data = np.load(te_path, allow_pickle=True)
-            self.te_vocab = data['vocab'].item()
-            self.te_vectors = data['vectors']
\ No newline at end of file
+        """Open the vocabulary stores, importing a legacy vocab.npz once"""
+        self._pending_terms = {}
+        self.en_vocab = VocabularyStore(os.path.join(self.VEC_EN_DIR, "vocab"), self.dimension)
+        self.te_vocab = VocabularyStore(os.path.join(self.VEC_TE_DIR, "vocab"), self.dimension)
+        import_legacy_vocabulary(self.en_vocab, os.path.join(self.VEC_EN_DIR, "vocab.npz"))
+        import_legacy_vocabulary(self.te_vocab, os.path.join(self.VEC_TE_DIR, "vocab.npz"))
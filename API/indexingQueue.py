@@ -0,0 +1,172 @@
+import time
+import threading
+from collections import OrderedDict
+
+class IndexingQueue:
+    """Background thread that indexes edited notes for an IndexerAPI in batches.
+
+    put() records the latest text of a note and returns at once. Edits to a
+    note that is still waiting replace its text, so only the latest version
+    is embedded. The worker waits up to delay seconds after an edit for more
+    edits to gather, then hands at most batch_size notes at a time to
+    IndexerAPI._index_queued.
+
+    If a batch fails, its notes are queued again after retry_delay seconds,
+    unless a newer edit of the note is already waiting. A note that fails
+    max_retries times is given up on and listed in failed until it is
+    edited again.
+    """
+
+    def __init__(self, indexer, batch_size=16, delay=0.0, max_retries=3, retry_delay=1.0):
+        self.indexer = indexer
+        self.batch_size = batch_size
+        self.delay = delay
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        # Reentrant, so IndexerAPI can hold it around writing a note and put()
+        self.lock = threading.Condition(threading.RLock())
+        self._pending = OrderedDict()
+        self._in_flight = 0
+        self._flushing = False
+        self._closed = False
+        self.enqueued = 0
+        self.coalesced = 0
+        self.indexed = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_error = None
+        # Failed attempts at the waiting edit of a note, and notes given up on
+        self._attempts = {}
+        self.failed = {}
+        self._thread = threading.Thread(target=self._run, name="IndexingQueue", daemon=True)
+        self._thread.start()
+
+    def put(self, fileName, text):
+        with self.lock:
+            if self._closed:
+                raise RuntimeError("The indexing queue is closed")
+            if fileName in self._pending:
+                self.coalesced += 1
+            self._pending[fileName] = (time.time(), text)
+            self._attempts.pop(fileName, None)
+            self.failed.pop(fileName, None)
+            self.enqueued += 1
+            self.lock.notify_all()
+
+    def discard(self, fileName):
+        """Drop a waiting edit of fileName. Returns False if there was none."""
+        with self.lock:
+            self._attempts.pop(fileName, None)
+            self.failed.pop(fileName, None)
+            return self._pending.pop(fileName, None) is not None
+
+    def __contains__(self, fileName):
+        with self.lock:
+            return fileName in self._pending
+
+    def __len__(self):
+        """Notes waiting or being indexed"""
+        with self.lock:
+            return len(self._pending) + self._in_flight
+
+    def wait(self, timeout=None):
+        """Block until every queued edit is indexed or given up on.
+
+        Returns False on timeout or if any edit was given up on (see failed).
+        """
+        with self.lock:
+            done = self.lock.wait_for(lambda: not self._pending and not self._in_flight, timeout)
+            return done and not self.failed
+
+    def flush(self, timeout=None):
+        """Index queued edits now, without waiting for delay, and block like wait()"""
+        with self.lock:
+            self._flushing = True
+            self.lock.notify_all()
+        try:
+            return self.wait(timeout)
+        finally:
+            with self.lock:
+                self._flushing = False
+
+    def close(self, timeout=None):
+        """Index what is queued, then stop the worker"""
+        with self.lock:
+            self._closed = True
+            self.lock.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self.lock:
+            oldest = min((created for created, _ in self._pending.values()), default=None)
+            return {
+                'pending': len(self._pending),
+                'in_flight': self._in_flight,
+                'oldest_age': time.time() - oldest if oldest is not None else 0.0,
+                'enqueued': self.enqueued,
+                'coalesced': self.coalesced,
+                'indexed': self.indexed,
+                'batches': self.batches,
+                'errors': self.errors,
+                'last_error': self.last_error,
+                'retrying': len(self._attempts),
+                'failed': sorted(self.failed)
+            }
+
+    def _take_batch(self):
+        with self.lock:
+            while not self._pending and not self._closed:
+                self.lock.wait()
+            if not self._pending:
+                return None
+            if self.delay and not self._flushing and not self._closed:
+                # Give further edits to the same notes a chance to coalesce
+                oldest = next(iter(self._pending.values()))[0]
+                self.lock.wait_for(lambda: self._flushing or self._closed, max(0.0, oldest + self.delay - time.time()))
+            batch = []
+            while self._pending and len(batch) < self.batch_size:
+                fileName, (_, text) = self._pending.popitem(last=False)
+                batch.append((fileName, text))
+            self._in_flight = len(batch)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            try:
+                self.indexer._index_queued(batch)
+            except Exception as e:
+                print(f"Error indexing queued notes: {str(e)}")
+                with self.lock:
+                    self.errors += 1
+                    self.last_error = str(e)
+                    self._retry(batch, str(e))
+                    self._in_flight = 0
+                    self.lock.notify_all()
+                    # Back off before trying again
+                    self.lock.wait_for(lambda: self._closed, self.retry_delay)
+                continue
+            with self.lock:
+                for fileName, _ in batch:
+                    self._attempts.pop(fileName, None)
+                self._in_flight = 0
+                self.indexed += len(batch)
+                self.batches += 1
+                self.lock.notify_all()
+
+    def _retry(self, batch, error):
+        """Queue the notes of a failed batch again, or give up on them after max_retries"""
+        for fileName, text in batch:
+            if fileName in self._pending:
+                # A newer edit replaces the one that failed
+                continue
+            attempts = self._attempts.get(fileName, 0) + 1
+            if attempts > self.max_retries:
+                self._attempts.pop(fileName, None)
+                self.failed[fileName] = error
+                print(f"Giving up indexing '{fileName}' after {attempts} attempts")
+            else:
+                self._attempts[fileName] = attempts
+                self._pending[fileName] = (time.time(), text)
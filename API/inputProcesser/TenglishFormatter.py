@@ -1,71 +1,48 @@
 import logging
 import os
-import pandas as pd
 import sys
 # Add the current directory to Python path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(current_dir)
 
 # Ensure the functions from stage1.py are available
-from stage1 import (
-    label_words_in_sentences,
-    transliterate_telugu_words,
-    replace_transliterated_words
-)
+from stage1 import convert_sentences
 
-def process_user_input(user_sentence):
+def process_user_input(user_sentence, debug_dir=None):
     """
     Takes a user input sentence, processes it through the transliteration pipeline, and returns the final output.
 
+    The pipeline runs in memory. Set debug_dir (or the TRANSLIT_DEBUG_DIR environment
+    variable) to also dump the intermediate CSV files for inspection.
+
     Args:
         user_sentence (str): The input sentence from the user.
+        debug_dir (str, optional): Directory for the intermediate CSV files.
 
     Returns:
         str: The processed sentence with Telugu words transliterated into Telugu script.
     """
-    # Define file paths
-    base_dir = os.getcwd()  # Current working directory
-    input_csv = os.path.join(base_dir, 'input.csv')  # Original input CSV with sentences
-    labeled_output_csv = os.path.join(base_dir, 'labeled_output.csv')  # Full labeled words
-    telugu_words_csv = os.path.join(base_dir, 'telugu_words.csv')  # Only Telugu words
-    conversion_input_csv = os.path.join(base_dir, 'telugu_conversion_input.csv')  # Input for transliteration
-    transliterated_output_csv = os.path.join(base_dir, 'telugu_terms_transliterated.csv')  # Transliteration output
-    final_output_csv = os.path.join(base_dir, 'final_output.csv')  # Final sentences with Telugu script
-
-    # Step 1: Write the user input to the input.csv file
-    input_data = pd.DataFrame({'sentence': [user_sentence]})
-    input_data.to_csv(input_csv, index=False)
-    logging.info("User input written to '{input_csv}'.")
-
-    # Step 2: Call the language detection and labeling function
-    label_words_in_sentences(
-        input_csv=input_csv,
-        output_labeled_csv=labeled_output_csv,
-        output_telugu_csv=telugu_words_csv,
-        conversion_input_csv=conversion_input_csv
-    )
-
-    # Step 3: Call the transliteration function
-    transliterate_telugu_words(
-        conversion_input_csv=conversion_input_csv,
-        transliterated_output_csv=transliterated_output_csv
-    )
+    return process_user_inputs([user_sentence], debug_dir=debug_dir)[0]
 
-    # Step 4: Call the replacement function to update the original sentence
-    replace_transliterated_words(
-        original_input_csv=input_csv,
-        transliteration_csv=transliterated_output_csv,
-        final_output_csv=final_output_csv
-    )
+def process_user_inputs(user_sentences, debug_dir=None):
+    """
+    Batch version of process_user_input.
 
-    # Step 5: Read the final output and return the modified sentence
-    df_final_output = pd.read_csv(final_output_csv)
-    final_sentence = df_final_output['sentence'].iloc[0]
-    
-    logging.info(f"Final sentence: {final_sentence}")
-    return final_sentence
+    Args:
+        user_sentences (list): The input sentences.
+        debug_dir (str, optional): Directory for the intermediate CSV files.
 
-# Example usage
-user_sentence = "nenu oka katha chadivanu"  # Example Latin-scripted Telugu sentence
-output_sentence = process_user_input(user_sentence)
-logging.info("Processed Sentence: {output_sentence}")
+    Returns:
+        list: The processed sentences, in input order.
+    """
+    debug_dir = debug_dir or os.getenv("TRANSLIT_DEBUG_DIR")
+    final_sentences = convert_sentences(user_sentences, debug_dir=debug_dir)
+    logging.info(f"Final sentences: {final_sentences}")
+    return final_sentences
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    # Example usage
+    user_sentence = "nenu oka katha chadivanu"  # Example Latin-scripted Telugu sentence
+    output_sentence = process_user_input(user_sentence)
+    logging.info(f"Processed Sentence: {output_sentence}")
@@ -1,239 +1,447 @@
-import nltk
-import os
-import sys
-from contextlib import redirect_stdout, redirect_stderr
-from io import StringIO
-from nltk.corpus import words
-from nltk.tokenize import word_tokenize
-import string
-import pandas as pd
-import csv
-import logging
-
-with redirect_stdout(StringIO()), redirect_stderr(StringIO()):
-    try:
-        nltk.data.find('tokenizers/punkt')
-    except LookupError:
-        nltk.download('punkt', quiet=True)
-    try:
-        nltk.data.find('corpora/words')
-    except LookupError:
-        nltk.download('words', quiet=True)
-
-def label_words_in_sentences(input_csv, output_labeled_csv, output_telugu_csv, conversion_input_csv):
-    """
-    Reads sentences from input_csv, labels each word, and saves the labeled data.
-
-    Args:
-        input_csv (str): Path to the input CSV file containing sentences.
-        output_labeled_csv (str): Path to save the full labeled output.
-        output_telugu_csv (str): Path to save only Telugu labeled words.
-        conversion_input_csv (str): Path to save the conversion input CSV.
-    """
-    # Define English vocabulary and punctuation
-    english_vocab = set(w.lower() for w in words.words())
-    punctuation = set(string.punctuation)
-
-    # Function to label words
-    def label_words(sentence):
-        tokens = word_tokenize(sentence)
-        labels = []
-        for token in tokens:
-            if token in punctuation:
-                labels.append('punct')
-                continue
-            # Normalize the word (remove non-alphabetic characters and convert to lowercase)
-            word = ''.join(char for char in token if char.isalpha()).lower()
-            if word in english_vocab:
-                labels.append('en')  # English
-            elif word:  # Non-empty and not in English vocab
-                labels.append('tel')  # Telugu or other non-English
-            else:
-                labels.append('other')  # Unknown tokens
-        return list(zip(tokens, labels))
-
-    # Step 1: Read sentences from the input CSV file
-    df_input = pd.read_csv(input_csv)
-    if 'sentence' not in df_input.columns:
-        raise ValueError("Input CSV must contain a 'sentence' column.")
-    sentences = df_input['sentence'].tolist()
-    logging.info("Loaded {len(sentences)} sentences from '{input_csv}'.")
-
-    # Step 2: Label all sentences
-    all_labeled = [label_words(sentence) for sentence in sentences]
-    logging.info("Completed labeling of all sentences.")
-
-    # Step 3: Flatten the data for DataFrame
-    words_list = []
-    labels_list = []
-    for sentence_labels in all_labeled:
-        for word, label in sentence_labels:
-            words_list.append(word)
-            labels_list.append(label)
-
-    # Step 4: Creating output DataFrame with labeled words
-    df_output = pd.DataFrame({'word': words_list, 'label': labels_list})
-
-    # Step 5: Saving the full labeled output to a CSV file
-    df_output.to_csv(output_labeled_csv, index=False)
-    logging.info("Full labeled data saved to '{output_labeled_csv}'.")
-
-    # Step 6: Filter for only 'tel' labeled words (Telugu words)
-    df_telugu = df_output[df_output['label'] == 'tel']
-    logging.info("Filtered {len(df_telugu)} Telugu words.")
-
-    # Step 7: Saving only the Telugu words to a separate CSV file
-    df_telugu.to_csv(output_telugu_csv, index=False)
-    logging.info("Telugu words saved to '{output_telugu_csv}'.")
-
-    # Step 8: Prepare the data for the next project by creating a DataFrame with 'Latin' and empty 'Telugu' columns
-    df_for_conversion = pd.DataFrame({
-        'Latin': df_telugu['word'],
-        'Telugu': [''] * len(df_telugu)
-    })
-
-    # Step 9: Save this DataFrame as the input CSV file for the conversion project
-    df_for_conversion.to_csv(conversion_input_csv, index=False)
-    logging.info("Conversion input file saved to '{conversion_input_csv}'.")
-
-def transliterate_telugu_words(conversion_input_csv, transliterated_output_csv):
-    """
-    Reads Latin-scripted Telugu words from conversion_input_csv, transliterates them,
-    and saves the results to transliterated_output_csv.
-
-    Args:
-        conversion_input_csv (str): Path to the input CSV file with Latin words.
-        transliterated_output_csv (str): Path to save the transliterated Telugu words.
-    """
-    # Import the transliteration function
-    try:
-        from translit_enhance import transliterate_word_enhanced
-    except ImportError:
-        raise ImportError("Module 'translit_enhance' not found. Ensure it is installed and accessible.")
-
-    input_path = conversion_input_csv
-    output_path = transliterated_output_csv
-
-    with open(input_path, 'r', encoding='utf-8') as infile, \
-         open(output_path, 'w', newline='', encoding='utf-8') as outfile:
-        
-        reader = csv.DictReader(infile)
-        fieldnames = ['Latin', 'Telugu']
-        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-        writer.writeheader()
-        
-        for row in reader:
-            latin_word = row['Latin']
-            telugu_word = transliterate_word_enhanced(latin_word)
-            writer.writerow({'Latin': latin_word, 'Telugu': telugu_word})
-    
-    logging.info("Transliteration completed. Check '{transliterated_output_csv}' for results.")
-
-def replace_transliterated_words(original_input_csv, transliteration_csv, final_output_csv):
-    """
-    Replaces Latin-scripted Telugu words in the original sentences with their Telugu script equivalents.
-
-    Args:
-        original_input_csv (str): Path to the original input CSV file containing sentences.
-        transliteration_csv (str): Path to the CSV file with transliterated Telugu words.
-        final_output_csv (str): Path to save the final modified sentences.
-    """
-    # Ensure NLTK data is downloaded
-    with redirect_stdout(StringIO()), redirect_stderr(StringIO()):
-        try:
-            nltk.data.find('tokenizers/punkt')
-        except LookupError:
-            nltk.download('punkt', quiet=True)
-        try:
-            nltk.data.find('corpora/words')
-        except LookupError:
-            nltk.download('words', quiet=True)
-
-
-
-    # Step 1: Read the original input sentences from the input CSV file
-    df_input = pd.read_csv(original_input_csv)
-    if 'sentence' not in df_input.columns:
-        raise ValueError("Original input CSV must contain a 'sentence' column.")
-    sentences = df_input['sentence'].tolist()
-    logging.info("Loaded {len(sentences)} sentences from '{original_input_csv}'.")
-
-    # Step 2: Read the Latin to Telugu conversion mapping from the transliteration output CSV file
-    df_conversion = pd.read_csv(transliteration_csv)
-    if 'Latin' not in df_conversion.columns or 'Telugu' not in df_conversion.columns:
-        raise ValueError("Transliteration CSV must contain 'Latin' and 'Telugu' columns.")
-    logging.info("Loaded {len(df_conversion)} transliteration mappings from '{transliteration_csv}'.")
-
-    # Step 3: Create a dictionary mapping from Latin-scripted words to their corresponding Telugu script
-    # Convert keys to lowercase to ensure case-insensitive matching
-    latin_to_telugu = {latin.lower(): telugu for latin, telugu in zip(df_conversion['Latin'], df_conversion['Telugu'])}
-    logging.info("Created Latin to Telugu mapping dictionary.")
-
-    # Step 4: Function to replace Latin-scripted Telugu words with Telugu script
-    def replace_latin_with_telugu(sentence, mapping):
-        tokens = word_tokenize(sentence)
-        modified_tokens = [
-            mapping.get(token.lower(), token)  # Replace if in mapping; else keep original
-            for token in tokens
-        ]
-        return ' '.join(modified_tokens)
-
-    # Step 5: Process each sentence
-    modified_sentences = [replace_latin_with_telugu(sentence, latin_to_telugu) for sentence in sentences]
-    logging.info("Completed replacing transliterated words in all sentences.")
-
-    # Step 6: Save the final modified sentences into a new CSV file
-    df_final_output = pd.DataFrame({'sentence': modified_sentences})
-    df_final_output.to_csv(final_output_csv, index=False)
-    logging.info("Final sentences saved to '{final_output_csv}'.")
-
-def main():
-    """
-    Main function to execute the language detection, transliteration, and replacement process.
-    """
-    # Define file paths
-    base_dir = os.getcwd()  # You can set this to any directory you prefer
-    input_csv = os.path.join(base_dir, 'input.csv')  # Original input CSV with sentences
-    labeled_output_csv = os.path.join(base_dir, 'labeled_output.csv')  # Full labeled words
-    telugu_words_csv = os.path.join(base_dir, 'telugu_words.csv')  # Only Telugu words
-    conversion_input_csv = os.path.join(base_dir, 'telugu_conversion_input.csv')  # Input for transliteration
-    transliterated_output_csv = os.path.join(base_dir, 'telugu_terms_transliterated.csv')  # Transliteration output
-    final_output_csv = os.path.join(base_dir, 'final_output.csv')  # Final sentences with Telugu script
-
-    # Check if input files exist
-    if not os.path.isfile(input_csv):
-        raise FileNotFoundError(f"Input file '{input_csv}' not found. Please ensure the file exists.")
-
-    # Stage 1: Language Detection and Labeling
-    label_words_in_sentences(
-        input_csv=input_csv,
-        output_labeled_csv=labeled_output_csv,
-        output_telugu_csv=telugu_words_csv,
-        conversion_input_csv=conversion_input_csv
-    )
-
-    # Stage 2: Transliteration of Telugu Words
-    # Check if the conversion input file exists
-    if not os.path.isfile(conversion_input_csv):
-        raise FileNotFoundError(f"Conversion input file '{conversion_input_csv}' not found.")
-    
-    transliterate_telugu_words(
-        conversion_input_csv=conversion_input_csv,
-        transliterated_output_csv=transliterated_output_csv
-    )
-
-    # Stage 3: Replacing Transliteration in Original Sentences
-    # Check if the transliteration output file exists
-    if not os.path.isfile(transliterated_output_csv):
-        raise FileNotFoundError(f"Transliteration output file '{transliterated_output_csv}' not found.")
-    
-    replace_transliterated_words(
-        original_input_csv=input_csv,
-        transliteration_csv=transliterated_output_csv,
-        final_output_csv=final_output_csv
-    )
-
-    logging.info("All stages completed successfully.")
-
-if __name__ == "__main__":
-    main()
+import nltk
+import os
+import sys
+from contextlib import redirect_stdout, redirect_stderr
+from io import StringIO
+from nltk.corpus import words
+from nltk.tokenize import word_tokenize
+import string
+import mmap
+import numpy as np
+import pandas as pd
+import csv
+import logging
+
+PUNCTUATION = set(string.punctuation)
+
+_nltk_data_checked = False
+
+def ensure_nltk_data():
+    """
+    Makes sure the NLTK tokenizer and word list are available. The lookups run once per process.
+    """
+    global _nltk_data_checked
+    if _nltk_data_checked:
+        return
+    with redirect_stdout(StringIO()), redirect_stderr(StringIO()):
+        try:
+            nltk.data.find('tokenizers/punkt')
+        except LookupError:
+            nltk.download('punkt', quiet=True)
+        try:
+            nltk.data.find('corpora/words')
+        except LookupError:
+            nltk.download('words', quiet=True)
+    _nltk_data_checked = True
+
+class SortedLexicon:
+    """
+    Read-only word set backed by a memory-mapped file of sorted, newline separated
+    UTF-8 words and an array of line offsets. Membership is a binary search, so
+    opening the lexicon costs two mmaps instead of building a 236k entry set.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._offsets = np.load(path + '.offsets.npy', mmap_mode='r')
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._data = b''
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __contains__(self, word):
+        key = word.encode('utf-8')
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            # Each entry is followed by a newline, which is excluded here
+            entry = self._data[self._offsets[mid]:self._offsets[mid + 1] - 1]
+            if entry < key:
+                lo = mid + 1
+            elif entry > key:
+                hi = mid
+            else:
+                return True
+        return False
+
+    @staticmethod
+    def write(path, words):
+        """
+        Writes words in the format read by SortedLexicon.
+
+        Args:
+            path (str): Path of the word file; offsets go to path + '.offsets.npy'.
+            words (iterable): Words to store. Duplicates are removed.
+        """
+        encoded = sorted(set(w.encode('utf-8') for w in words))
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(w) + 1 for w in encoded], out=offsets[1:])
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b''.join(w + b'\n' for w in encoded))
+        np.save(path + '.offsets.npy', offsets)
+
+class LanguageLabeler:
+    """
+    Labels tokens as English or Telugu using the NLTK English word list.
+
+    The lexicon is loaded on first use and then kept for the lifetime of the object.
+    With a lexicon_path it is read from (or, on first use, written to) a SortedLexicon
+    file, which is memory-mapped instead of being rebuilt from NLTK.
+    """
+
+    def __init__(self, lexicon_path=None):
+        self.lexicon_path = lexicon_path
+        self._english_vocab = None
+
+    @property
+    def english_vocab(self):
+        if self._english_vocab is None:
+            self._english_vocab = self._load_lexicon()
+        return self._english_vocab
+
+    def _load_lexicon(self):
+        if self.lexicon_path and os.path.exists(self.lexicon_path + '.offsets.npy'):
+            logging.info(f"Mapping English lexicon from '{self.lexicon_path}'.")
+            return SortedLexicon(self.lexicon_path)
+        ensure_nltk_data()
+        english_vocab = frozenset(w.lower() for w in words.words())
+        if self.lexicon_path:
+            SortedLexicon.write(self.lexicon_path, english_vocab)
+            logging.info(f"English lexicon saved to '{self.lexicon_path}'.")
+        return english_vocab
+
+    def label_sentence(self, sentence):
+        ensure_nltk_data()
+        return label_sentence(sentence, self.english_vocab)
+
+    def label_sentences(self, sentences):
+        ensure_nltk_data()
+        english_vocab = self.english_vocab
+        return [label_sentence(sentence, english_vocab) for sentence in sentences]
+
+_default_labeler = None
+
+def get_labeler():
+    """
+    Returns the process-wide LanguageLabeler. Set ENGLISH_LEXICON_PATH to persist the lexicon.
+    """
+    global _default_labeler
+    if _default_labeler is None:
+        _default_labeler = LanguageLabeler(os.getenv("ENGLISH_LEXICON_PATH"))
+    return _default_labeler
+
+def label_sentence(sentence, english_vocab, punctuation=PUNCTUATION):
+    """
+    Tokenizes a sentence and labels each token as 'en', 'tel', 'punct' or 'other'.
+
+    Args:
+        sentence (str): The sentence to label.
+        english_vocab (set): Lowercased English words.
+        punctuation (set): Tokens treated as punctuation.
+
+    Returns:
+        list: (token, label) pairs in sentence order.
+    """
+    tokens = word_tokenize(sentence)
+    labels = []
+    for token in tokens:
+        if token in punctuation:
+            labels.append('punct')
+            continue
+        # Normalize the word (remove non-alphabetic characters and convert to lowercase)
+        word = ''.join(char for char in token if char.isalpha()).lower()
+        if word in english_vocab:
+            labels.append('en')  # English
+        elif word:  # Non-empty and not in English vocab
+            labels.append('tel')  # Telugu or other non-English
+        else:
+            labels.append('other')  # Unknown tokens
+    return list(zip(tokens, labels))
+
+def label_sentences(sentences, labeler=None):
+    """
+    Labels every token of every sentence in memory.
+
+    Args:
+        sentences (list): Sentences to label.
+        labeler (LanguageLabeler, optional): Defaults to the shared get_labeler() instance.
+
+    Returns:
+        list: One list of (token, label) pairs per sentence.
+    """
+    return (labeler or get_labeler()).label_sentences(sentences)
+
+def transliterate_labeled_words(labeled_sentences):
+    """
+    Transliterates every 'tel' labeled token into Telugu script.
+
+    Args:
+        labeled_sentences (list): Output of label_sentences.
+
+    Returns:
+        dict: Lowercased Latin word -> Telugu script word.
+    """
+    try:
+        from translit_enhance import transliterate_word_enhanced
+    except ImportError:
+        raise ImportError("Module 'translit_enhance' not found. Ensure it is installed and accessible.")
+
+    latin_to_telugu = {}
+    for sentence_labels in labeled_sentences:
+        for word, label in sentence_labels:
+            if label == 'tel':
+                latin_to_telugu[word.lower()] = transliterate_word_enhanced(word)
+    return latin_to_telugu
+
+def replace_labeled_words(labeled_sentences, latin_to_telugu):
+    """
+    Rebuilds each sentence with Latin-scripted Telugu tokens replaced by their Telugu script.
+
+    Args:
+        labeled_sentences (list): Output of label_sentences.
+        latin_to_telugu (dict): Lowercased Latin word -> Telugu script word.
+
+    Returns:
+        list: The modified sentences.
+    """
+    return [
+        ' '.join(latin_to_telugu.get(token.lower(), token) for token, _ in sentence_labels)
+        for sentence_labels in labeled_sentences
+    ]
+
+def convert_sentences(sentences, debug_dir=None):
+    """
+    Runs labeling, transliteration and replacement on a list of sentences without touching disk.
+
+    Args:
+        sentences (list): Sentences in code-mixed Roman script.
+        debug_dir (str, optional): If given, the intermediate CSV files of the
+            file based pipeline are written to this directory for inspection.
+
+    Returns:
+        list: The sentences with Telugu words transliterated into Telugu script.
+    """
+    labeled = label_sentences(sentences)
+    latin_to_telugu = transliterate_labeled_words(labeled)
+    converted = replace_labeled_words(labeled, latin_to_telugu)
+    if debug_dir:
+        dump_pipeline_csvs(debug_dir, sentences, labeled, converted)
+    return converted
+
+def dump_pipeline_csvs(debug_dir, sentences, labeled_sentences, converted_sentences):
+    """
+    Writes the intermediate CSV files of the pipeline, using the same names and columns as main().
+
+    Args:
+        debug_dir (str): Directory to write the CSV files to.
+        sentences (list): Original sentences.
+        labeled_sentences (list): Output of label_sentences.
+        converted_sentences (list): Output of replace_labeled_words.
+    """
+    from translit_enhance import transliterate_word_enhanced
+
+    os.makedirs(debug_dir, exist_ok=True)
+    df_output = pd.DataFrame(
+        [(word, label) for sentence_labels in labeled_sentences for word, label in sentence_labels],
+        columns=['word', 'label']
+    )
+    df_telugu = df_output[df_output['label'] == 'tel']
+
+    pd.DataFrame({'sentence': sentences}).to_csv(os.path.join(debug_dir, 'input.csv'), index=False)
+    df_output.to_csv(os.path.join(debug_dir, 'labeled_output.csv'), index=False)
+    df_telugu.to_csv(os.path.join(debug_dir, 'telugu_words.csv'), index=False)
+    pd.DataFrame({
+        'Latin': df_telugu['word'],
+        'Telugu': [''] * len(df_telugu)
+    }).to_csv(os.path.join(debug_dir, 'telugu_conversion_input.csv'), index=False)
+    pd.DataFrame({
+        'Latin': df_telugu['word'],
+        'Telugu': [transliterate_word_enhanced(word) for word in df_telugu['word']]
+    }).to_csv(os.path.join(debug_dir, 'telugu_terms_transliterated.csv'), index=False)
+    pd.DataFrame({'sentence': converted_sentences}).to_csv(os.path.join(debug_dir, 'final_output.csv'), index=False)
+    logging.info(f"Pipeline CSV files written to '{debug_dir}'.")
+
+def label_words_in_sentences(input_csv, output_labeled_csv, output_telugu_csv, conversion_input_csv):
+    """
+    Reads sentences from input_csv, labels each word, and saves the labeled data.
+
+    Args:
+        input_csv (str): Path to the input CSV file containing sentences.
+        output_labeled_csv (str): Path to save the full labeled output.
+        output_telugu_csv (str): Path to save only Telugu labeled words.
+        conversion_input_csv (str): Path to save the conversion input CSV.
+    """
+    # Step 1: Read sentences from the input CSV file
+    df_input = pd.read_csv(input_csv)
+    if 'sentence' not in df_input.columns:
+        raise ValueError("Input CSV must contain a 'sentence' column.")
+    sentences = df_input['sentence'].tolist()
+    logging.info("Loaded {len(sentences)} sentences from '{input_csv}'.")
+
+    # Step 2: Label all sentences
+    all_labeled = label_sentences(sentences)
+    logging.info("Completed labeling of all sentences.")
+
+    # Step 3: Flatten the data for DataFrame
+    words_list = []
+    labels_list = []
+    for sentence_labels in all_labeled:
+        for word, label in sentence_labels:
+            words_list.append(word)
+            labels_list.append(label)
+
+    # Step 4: Creating output DataFrame with labeled words
+    df_output = pd.DataFrame({'word': words_list, 'label': labels_list})
+
+    # Step 5: Saving the full labeled output to a CSV file
+    df_output.to_csv(output_labeled_csv, index=False)
+    logging.info("Full labeled data saved to '{output_labeled_csv}'.")
+
+    # Step 6: Filter for only 'tel' labeled words (Telugu words)
+    df_telugu = df_output[df_output['label'] == 'tel']
+    logging.info("Filtered {len(df_telugu)} Telugu words.")
+
+    # Step 7: Saving only the Telugu words to a separate CSV file
+    df_telugu.to_csv(output_telugu_csv, index=False)
+    logging.info("Telugu words saved to '{output_telugu_csv}'.")
+
+    # Step 8: Prepare the data for the next project by creating a DataFrame with 'Latin' and empty 'Telugu' columns
+    df_for_conversion = pd.DataFrame({
+        'Latin': df_telugu['word'],
+        'Telugu': [''] * len(df_telugu)
+    })
+
+    # Step 9: Save this DataFrame as the input CSV file for the conversion project
+    df_for_conversion.to_csv(conversion_input_csv, index=False)
+    logging.info("Conversion input file saved to '{conversion_input_csv}'.")
+
+def transliterate_telugu_words(conversion_input_csv, transliterated_output_csv):
+    """
+    Reads Latin-scripted Telugu words from conversion_input_csv, transliterates them,
+    and saves the results to transliterated_output_csv.
+
+    Args:
+        conversion_input_csv (str): Path to the input CSV file with Latin words.
+        transliterated_output_csv (str): Path to save the transliterated Telugu words.
+    """
+    # Import the transliteration function
+    try:
+        from translit_enhance import transliterate_word_enhanced
+    except ImportError:
+        raise ImportError("Module 'translit_enhance' not found. Ensure it is installed and accessible.")
+
+    input_path = conversion_input_csv
+    output_path = transliterated_output_csv
+
+    with open(input_path, 'r', encoding='utf-8') as infile, \
+         open(output_path, 'w', newline='', encoding='utf-8') as outfile:
+        
+        reader = csv.DictReader(infile)
+        fieldnames = ['Latin', 'Telugu']
+        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
+        writer.writeheader()
+        
+        for row in reader:
+            latin_word = row['Latin']
+            telugu_word = transliterate_word_enhanced(latin_word)
+            writer.writerow({'Latin': latin_word, 'Telugu': telugu_word})
+    
+    logging.info("Transliteration completed. Check '{transliterated_output_csv}' for results.")
+
+def replace_transliterated_words(original_input_csv, transliteration_csv, final_output_csv):
+    """
+    Replaces Latin-scripted Telugu words in the original sentences with their Telugu script equivalents.
+
+    Args:
+        original_input_csv (str): Path to the original input CSV file containing sentences.
+        transliteration_csv (str): Path to the CSV file with transliterated Telugu words.
+        final_output_csv (str): Path to save the final modified sentences.
+    """
+    # Ensure NLTK data is downloaded
+    ensure_nltk_data()
+
+    # Step 1: Read the original input sentences from the input CSV file
+    df_input = pd.read_csv(original_input_csv)
+    if 'sentence' not in df_input.columns:
+        raise ValueError("Original input CSV must contain a 'sentence' column.")
+    sentences = df_input['sentence'].tolist()
+    logging.info("Loaded {len(sentences)} sentences from '{original_input_csv}'.")
+
+    # Step 2: Read the Latin to Telugu conversion mapping from the transliteration output CSV file
+    df_conversion = pd.read_csv(transliteration_csv)
+    if 'Latin' not in df_conversion.columns or 'Telugu' not in df_conversion.columns:
+        raise ValueError("Transliteration CSV must contain 'Latin' and 'Telugu' columns.")
+    logging.info("Loaded {len(df_conversion)} transliteration mappings from '{transliteration_csv}'.")
+
+    # Step 3: Create a dictionary mapping from Latin-scripted words to their corresponding Telugu script
+    # Convert keys to lowercase to ensure case-insensitive matching
+    latin_to_telugu = {latin.lower(): telugu for latin, telugu in zip(df_conversion['Latin'], df_conversion['Telugu'])}
+    logging.info("Created Latin to Telugu mapping dictionary.")
+
+    # Step 4: Tokenize each sentence and replace Latin-scripted Telugu words with Telugu script
+    tokenized = [[(token, None) for token in word_tokenize(sentence)] for sentence in sentences]
+    modified_sentences = replace_labeled_words(tokenized, latin_to_telugu)
+    logging.info("Completed replacing transliterated words in all sentences.")
+
+    # Step 5: Save the final modified sentences into a new CSV file
+    df_final_output = pd.DataFrame({'sentence': modified_sentences})
+    df_final_output.to_csv(final_output_csv, index=False)
+    logging.info("Final sentences saved to '{final_output_csv}'.")
+
+def main():
+    """
+    Main function to execute the language detection, transliteration, and replacement process.
+    """
+    # Define file paths
+    base_dir = os.getcwd()  # You can set this to any directory you prefer
+    input_csv = os.path.join(base_dir, 'input.csv')  # Original input CSV with sentences
+    labeled_output_csv = os.path.join(base_dir, 'labeled_output.csv')  # Full labeled words
+    telugu_words_csv = os.path.join(base_dir, 'telugu_words.csv')  # Only Telugu words
+    conversion_input_csv = os.path.join(base_dir, 'telugu_conversion_input.csv')  # Input for transliteration
+    transliterated_output_csv = os.path.join(base_dir, 'telugu_terms_transliterated.csv')  # Transliteration output
+    final_output_csv = os.path.join(base_dir, 'final_output.csv')  # Final sentences with Telugu script
+
+    # Check if input files exist
+    if not os.path.isfile(input_csv):
+        raise FileNotFoundError(f"Input file '{input_csv}' not found. Please ensure the file exists.")
+
+    # Stage 1: Language Detection and Labeling
+    label_words_in_sentences(
+        input_csv=input_csv,
+        output_labeled_csv=labeled_output_csv,
+        output_telugu_csv=telugu_words_csv,
+        conversion_input_csv=conversion_input_csv
+    )
+
+    # Stage 2: Transliteration of Telugu Words
+    # Check if the conversion input file exists
+    if not os.path.isfile(conversion_input_csv):
+        raise FileNotFoundError(f"Conversion input file '{conversion_input_csv}' not found.")
+    
+    transliterate_telugu_words(
+        conversion_input_csv=conversion_input_csv,
+        transliterated_output_csv=transliterated_output_csv
+    )
+
+    # Stage 3: Replacing Transliteration in Original Sentences
+    # Check if the transliteration output file exists
+    if not os.path.isfile(transliterated_output_csv):
+        raise FileNotFoundError(f"Transliteration output file '{transliterated_output_csv}' not found.")
+    
+    replace_transliterated_words(
+        original_input_csv=input_csv,
+        transliteration_csv=transliterated_output_csv,
+        final_output_csv=final_output_csv
+    )
+
+    logging.info("All stages completed successfully.")
+
+if __name__ == "__main__":
+    main()
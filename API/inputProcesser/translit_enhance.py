@@ -1,87 +1,111 @@
-# transliterate_enhanced.py
-
-from tel_transliterate import latin_to_telugu
-from tel_vowel_signs import vowel_signs
-
-# Define vowels and consonants
-vowels = ['a', 'aa', 'i', 'ii', 'u', 'uu', 'e', 'ee', 'ai', 'o', 'oo', 'au', 'ri']
-consonants = [
-    'kshn', 'ksh', 'shn', 'kh', 'gh', 'ch', 'jh',
-    'th', 'dh', 'ph', 'bh', 'sh',
-    'gn', 'tr', 'tth', 'ddh', 'nj',
-    'nn', 'tt', 'dd',
-    'k', 'g', 'c', 'j',
-    't', 'd', 'n', 'p', 'b',
-    'm', 'y', 'r', 'l', 'v',
-    's', 'h',
-]
-
-# Sort consonants and vowels by length in descending order to match longer patterns first
-consonants_sorted = sorted(consonants, key=lambda x: -len(x))
-vowels_sorted = sorted(vowels, key=lambda x: -len(x))
-
-def transliterate_word_enhanced(latin_word):
-    telugu_word = ""
-    i = 0
-    length = len(latin_word)
-    
-    while i < length:
-        matched = False
-        
-        # Attempt to match consonant
-        for cons in consonants_sorted:
-            cons_len = len(cons)
-            segment = latin_word[i:i+cons_len].lower()
-            if segment == cons:
-                telugu_consonant = latin_to_telugu.get(cons)
-                if telugu_consonant:
-                    i += cons_len
-                    # Check if the next segment starts with a consonant
-                    is_next_consonant = False
-                    for next_cons in consonants_sorted:
-                        next_cons_len = len(next_cons)
-                        if latin_word[i:i+next_cons_len].lower() == next_cons:
-                            is_next_consonant = True
-                            break
-                    if is_next_consonant:
-                        # Append consonant with virama to suppress inherent 'a'
-                        telugu_word += telugu_consonant + '్'
-                    else:
-                        # Attempt to match vowel after consonant
-                        vowel_matched = False
-                        for vowel in vowels_sorted:
-                            vowel_len = len(vowel)
-                            vowel_segment = latin_word[i:i+vowel_len].lower()
-                            if vowel_segment == vowel:
-                                vowel_sign = vowel_signs.get(vowel, '')
-                                telugu_word += telugu_consonant + vowel_sign
-                                i += vowel_len
-                                vowel_matched = True
-                                break
-                        if not vowel_matched:
-                            # No vowel follows; append consonant with inherent 'a'
-                            telugu_word += telugu_consonant
-                    matched = True
-                    break  # Consonant matched; proceed to next character
-        if matched:
-            continue  # Proceed to next iteration of the while loop
-        
-        # Attempt to match standalone vowel
-        for vowel in vowels_sorted:
-            vowel_len = len(vowel)
-            vowel_segment = latin_word[i:i+vowel_len].lower()
-            if vowel_segment == vowel:
-                telugu_vowel = latin_to_telugu.get(vowel)
-                if telugu_vowel:
-                    telugu_word += telugu_vowel
-                    i += vowel_len
-                matched = True
-                break
-        if matched:
-            continue  # Proceed to next iteration of the while loop
-        
-        # If no match found, append the character as is or handle accordingly
-        telugu_word += latin_word[i]
-        i += 1
-    
-    return telugu_word
+# transliterate_enhanced.py
+
+from tel_transliterate import latin_to_telugu
+from tel_vowel_signs import vowel_signs
+from functools import lru_cache
+
+# Define vowels and consonants
+vowels = ['a', 'aa', 'i', 'ii', 'u', 'uu', 'e', 'ee', 'ai', 'o', 'oo', 'au', 'ri']
+consonants = [
+    'kshn', 'ksh', 'shn', 'kh', 'gh', 'ch', 'jh',
+    'th', 'dh', 'ph', 'bh', 'sh',
+    'gn', 'tr', 'tth', 'ddh', 'nj',
+    'nn', 'tt', 'dd',
+    'k', 'g', 'c', 'j',
+    't', 'd', 'n', 'p', 'b',
+    'm', 'y', 'r', 'l', 'v',
+    's', 'h',
+]
+
+# Sort consonants and vowels by length in descending order to match longer patterns first
+consonants_sorted = sorted(consonants, key=lambda x: -len(x))
+vowels_sorted = sorted(vowels, key=lambda x: -len(x))
+
+def _build_trie(keys, table):
+    """Build a character trie mapping each key to table[key]; the value is stored under ''."""
+    trie = {}
+    for key in keys:
+        node = trie
+        for char in key:
+            node = node.setdefault(char, {})
+        node[''] = table[key]
+    return trie
+
+# Tries built once at import; each holds only the patterns the scanner is allowed to match
+consonant_trie = _build_trie(consonants, latin_to_telugu)
+vowel_trie = _build_trie(vowels, latin_to_telugu)
+vowel_sign_trie = _build_trie(vowels, vowel_signs)
+
+def _lower_chars(latin_word):
+    """
+    Lowercase a word character by character. Characters whose lowercase form is not a single
+    character can never be part of a match, so they become None, which no trie contains.
+    """
+    chars = []
+    for char in latin_word:
+        lowered = char.lower()
+        chars.append(lowered if len(lowered) == 1 else None)
+    return chars
+
+def _longest_match(trie, chars, i):
+    """Return (value, length) of the longest pattern in trie starting at chars[i], or (None, 0)."""
+    node = trie
+    value, length = None, 0
+    j = i
+    while j < len(chars):
+        node = node.get(chars[j])
+        if node is None:
+            break
+        j += 1
+        if '' in node:
+            value, length = node[''], j - i
+    return value, length
+
+def _transliterate(latin_word):
+    chars = _lower_chars(latin_word)
+    telugu_word = []
+    i = 0
+    length = len(latin_word)
+
+    while i < length:
+        # Attempt to match consonant
+        telugu_consonant, cons_len = _longest_match(consonant_trie, chars, i)
+        if cons_len:
+            i += cons_len
+            if _longest_match(consonant_trie, chars, i)[1]:
+                # Next segment starts with a consonant: append virama to suppress inherent 'a'
+                telugu_word.append(telugu_consonant + '్')
+            else:
+                # Attempt to match vowel after consonant; with no vowel the inherent 'a' remains
+                vowel_sign, vowel_len = _longest_match(vowel_sign_trie, chars, i)
+                telugu_word.append(telugu_consonant + (vowel_sign or ''))
+                i += vowel_len
+            continue
+
+        # Attempt to match standalone vowel
+        telugu_vowel, vowel_len = _longest_match(vowel_trie, chars, i)
+        if vowel_len:
+            telugu_word.append(telugu_vowel)
+            i += vowel_len
+            continue
+
+        # If no match found, append the character as is
+        telugu_word.append(latin_word[i])
+        i += 1
+
+    return ''.join(telugu_word)
+
+_transliterate_cached = lru_cache(maxsize=65536)(_transliterate)
+
+def transliterate_word_enhanced(latin_word):
+    """
+    Transliterate a Latin-scripted Telugu word into Telugu script.
+
+    Consonants and vowels are matched longest-first with precompiled tries, and results
+    are memoised in an LRU cache since the same words recur across notes.
+    """
+    return _transliterate_cached(latin_word)
+
+def transliterate_many(latin_words):
+    """Transliterate an iterable of words, returning a list in the same order."""
+    return [_transliterate_cached(word) for word in latin_words]
@@ -0,0 +1,216 @@
+import os
+import json
+import math
+import string
+from collections import Counter
+
+def tokenize(text):
+    """Lexical tokens of processed note text: romanised words lowercased, Telugu script as is"""
+    tokens = []
+    for word in text.split():
+        word = word.strip(string.punctuation)
+        if word:
+            tokens.append(word.lower() if word.isascii() else word)
+    return tokens
+
+class LexicalIndex:
+    """Inverted index of note tokens with BM25 scoring, keyed by note id.
+
+    Holds a postings list ({note_id: term frequency}) per token, each note's
+    length and the total length, so document frequencies and the average
+    length come for free. Updates are appended to a log of JSON lines, one
+    per note, that other processes replay; compact() folds the log into a
+    new snapshot. Directory layout:
+
+        meta.json               generation of the files below
+        notes.<gen>.json        {note_id: {term: frequency}} at compaction
+        log.<gen>.jsonl         {"note": id, "terms": {...} or null} since then
+    """
+
+    def __init__(self, directory, k1=1.2, b=0.75, compact_min_bytes=1 << 20):
+        self.directory = directory
+        self.k1 = k1
+        self.b = b
+        self.compact_min_bytes = compact_min_bytes
+        os.makedirs(directory, exist_ok=True)
+        if not os.path.exists(self._path('meta.json')):
+            self._write_meta(0)
+        self._meta_mtime = None
+        self.refresh()
+
+    def _path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def _write_meta(self, generation):
+        with open(self._path('meta.json.tmp'), 'w') as f:
+            json.dump({'generation': generation}, f)
+        os.replace(self._path('meta.json.tmp'), self._path('meta.json'))
+
+    def _log_path(self, generation=None):
+        return self._path(f"log.{self.generation if generation is None else generation}.jsonl")
+
+    def _snapshot_path(self, generation=None):
+        return self._path(f"notes.{self.generation if generation is None else generation}.json")
+
+    def refresh(self):
+        """Pick up updates another process saved. Returns True if anything changed."""
+        meta_mtime = os.stat(self._path('meta.json')).st_mtime_ns
+        if meta_mtime != self._meta_mtime:
+            self._load()
+            self._meta_mtime = meta_mtime
+            return True
+        try:
+            size = os.stat(self._log_path()).st_size
+        except FileNotFoundError:
+            size = 0
+        if size < self._log_bytes:
+            self._load()
+            return True
+        if size > self._log_bytes:
+            self._replay()
+            return True
+        return False
+
+    def _load(self):
+        with open(self._path('meta.json'), 'r') as f:
+            self.generation = json.load(f)['generation']
+        self.doc_terms = {}
+        self.postings = {}
+        self.lengths = {}
+        self.total_length = 0
+        try:
+            with open(self._snapshot_path(), 'r', encoding='utf-8') as f:
+                for note_id, terms in json.load(f).items():
+                    self._apply(note_id, terms)
+        except FileNotFoundError:
+            pass
+        self._log_bytes = 0
+        self._replay()
+
+    def _replay(self):
+        """Apply the complete log lines after the ones already applied"""
+        try:
+            with open(self._log_path(), 'rb') as f:
+                f.seek(self._log_bytes)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # A line without its newline was cut short by an interrupted write
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            record = json.loads(line)
+            self._apply(record['note'], record['terms'])
+        self._log_bytes += end
+
+    def _apply(self, note_id, terms):
+        """Replace the postings of note_id with terms, or remove them if terms is None"""
+        for term in self.doc_terms.pop(note_id, {}):
+            postings = self.postings[term]
+            del postings[note_id]
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.lengths.pop(note_id, 0)
+        if not terms:
+            return
+        self.doc_terms[note_id] = terms
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, {})[note_id] = frequency
+        self.lengths[note_id] = sum(terms.values())
+        self.total_length += self.lengths[note_id]
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __contains__(self, note_id):
+        return note_id in self.lengths
+
+    @property
+    def version(self):
+        return f"{self.generation}.{self._log_bytes}"
+
+    def put_many(self, items):
+        """Index (note_id, text) items, replacing what those notes had before"""
+        records = []
+        for note_id, text in items:
+            terms = dict(Counter(tokenize(text)))
+            self._apply(note_id, terms)
+            records.append(json.dumps({'note': note_id, 'terms': terms}, ensure_ascii=False))
+        self._write_log(records)
+
+    def delete(self, note_id):
+        """Remove note_id. Returns False if it was not indexed."""
+        if note_id not in self:
+            return False
+        self._apply(note_id, None)
+        self._write_log([json.dumps({'note': note_id, 'terms': None}, ensure_ascii=False)])
+        return True
+
+    def _write_log(self, records):
+        if not records:
+            return
+        data = ''.join(record + '\n' for record in records).encode('utf-8')
+        # Writing at the expected offset (and truncating) discards a partial line left by an interrupted write
+        path = self._log_path()
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+            f.seek(self._log_bytes)
+            f.write(data)
+            f.truncate()
+        self._log_bytes += len(data)
+        try:
+            snapshot_bytes = os.stat(self._snapshot_path()).st_size
+        except FileNotFoundError:
+            snapshot_bytes = 0
+        if self._log_bytes > max(self.compact_min_bytes, snapshot_bytes):
+            self.compact()
+
+    def compact(self):
+        """Write the current postings as the next generation's snapshot and start an empty log"""
+        generation = self.generation + 1
+        with open(self._snapshot_path(generation), 'w', encoding='utf-8') as f:
+            json.dump(self.doc_terms, f, ensure_ascii=False)
+        self._write_meta(generation)
+        old_generation = self.generation
+        self._meta_mtime = None
+        self.refresh()
+        for path in (self._snapshot_path(old_generation), self._log_path(old_generation)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def scores(self, query, note_ids=None):
+        """{note_id: BM25 score} of the notes sharing a token with query, or of note_ids only"""
+        count = len(self)
+        if not count:
+            return {}
+        average_length = self.total_length / count
+        scores = {}
+        for term, query_frequency in Counter(tokenize(query)).items():
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            if note_ids is not None:
+                postings = {note_id: postings[note_id] for note_id in note_ids if note_id in postings}
+            for note_id, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[note_id] / average_length)
+                scores[note_id] = scores.get(note_id, 0.0) + query_frequency * idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return scores
+
+    def top(self, query, k):
+        """The k best (note_id, score) pairs for query, best first"""
+        scores = self.scores(query)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+def import_notes(index, note_ids, notes_directory):
+    """Index the text of note_ids that are stored but missing from index"""
+    items = []
+    for note_id in note_ids:
+        path = os.path.join(notes_directory, f"{note_id}.txt")
+        if note_id not in index and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                items.append((note_id, f.read()))
+    index.put_many(items)
+    if items:
+        print(f"Added {len(items)} notes to the lexical index in {index.directory}")
+    return len(items)
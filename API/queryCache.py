@@ -0,0 +1,110 @@
+import os
+import time
+import hashlib
+import numpy as np
+from collections import OrderedDict
+
+class QueryEmbeddingCache:
+    """Bounded LRU cache of query embeddings with optional TTL and disk tier.
+
+    Entries are keyed by the processed query with whitespace collapsed and hold
+    the BERT and RI query vectors. The RI vector depends on the RI vocabularies,
+    so each entry also records the vocabulary version it was computed with;
+    callers recompute just the RI part when that version is outdated.
+    With a directory, entries are also written there as .npz files and found
+    again by later processes.
+    """
+
+    def __init__(self, maxsize=256, ttl=None, directory=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(query):
+        return ' '.join(query.split())
+
+    def _disk_path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.npz')
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, query):
+        """Return (bert, ri, ri_version) for query, or None"""
+        key = self.normalize(query)
+        entry = self._entries.get(key)
+        if entry is not None and self._expired(entry[0]):
+            del self._entries[key]
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1:]
+        if self.directory:
+            entry = self._load(key)
+            if entry is not None:
+                self.disk_hits += 1
+                self._remember(key, entry)
+                return entry[1:]
+        self.misses += 1
+        return None
+
+    def put(self, query, bert, ri, ri_version):
+        key = self.normalize(query)
+        entry = (time.time(), bert, ri, ri_version)
+        self._remember(key, entry)
+        if self.directory:
+            path = self._disk_path(key)
+            with open(path + '.tmp', 'wb') as f:
+                np.savez(f, key=key, created=entry[0], bert=bert, ri=ri, ri_version=str(ri_version))
+            os.replace(path + '.tmp', path)
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _load(self, key):
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                # Guard against hash collisions
+                if str(data['key']) != key:
+                    return None
+                created = float(data['created'])
+                entry = (created, data['bert'], data['ri'], str(data['ri_version']))
+        except (OSError, ValueError, KeyError):
+            return None
+        if self._expired(created):
+            os.remove(path)
+            return None
+        return entry
+
+    def clear(self):
+        """Drop all entries, including the disk tier"""
+        self._entries.clear()
+        if self.directory:
+            for filename in os.listdir(self.directory):
+                if filename.endswith('.npz'):
+                    os.remove(os.path.join(self.directory, filename))
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
@@ -1,17 +1,45 @@
 from dotenv import load_dotenv
 import os
-import torch
+import json
 import numpy as np
-from transformers import BertTokenizer, BertModel
-from sklearn.metrics.pairwise import cosine_similarity
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), 'inputProcesser'))
 from TenglishFormatter import process_user_input
-from ri import dsm ,make_index, weight_func, remove_centroid
+from ri import SVDProjection
+from encoder import get_encoder
+from embeddingStore import EmbeddingStore
+from annIndex import NoteAnnIndex, normalize_rows
+from queryCache import QueryEmbeddingCache
+from vocabStore import VocabularyStore
+from lexicalIndex import LexicalIndex
 
 class RetrievalAPI:
-    def __init__(self, dimension=300, nonzeros=8, delta=60):
-        """Initialize retrieval system"""
+    def __init__(self, dimension=300, nonzeros=8, delta=60, ann_backend=None, ann_params=None, ann_candidates=100,
+                 query_cache_size=256, query_cache_ttl=None, query_cache_dir=None, chunk_overlap=128,
+                 lexical_weight=0.0, lexical_candidates=None):
+        """Initialize retrieval system
+
+        With ann_backend ('flat', 'ivf', 'hnsw' or 'annoy', default $ANN_BACKEND)
+        each query takes the ann_candidates nearest notes in the BERT and RI
+        spaces from the ANN index and scores only those exactly. The index is
+        the one IndexerAPI saved with the same backend and params; while
+        there is none, every note is scored.
+        ann_params defaults to $ANN_PARAMS (a JSON object).
+
+        Query embeddings are cached for the last query_cache_size queries,
+        optionally expiring after query_cache_ttl seconds and persisted to
+        query_cache_dir (default $QUERY_CACHE_DIR).
+
+        chunk_overlap must match the IndexerAPI that stored the window vectors
+        searched by find_passages.
+
+        The BM25 index kept by IndexerAPI adds lexical_weight times each note's
+        BM25 score (relative to the best) to its score, and with
+        lexical_candidates only the notes with the lexical_candidates best BM25
+        scores (plus any ANN candidates) are scored densely; queries without a
+        matching token still scan every note. find_keywords answers from the
+        BM25 index alone.
+        """
         load_dotenv()
         self.NOTES_DIRECTORY = os.getenv("NOTES_DIRECTORY")
         self.EMBEDDINGS_DIRECTORY = os.getenv("EMBEDDINGS_DIRECTORY")
@@ -23,71 +51,204 @@ class RetrievalAPI:
                          self.VEC_EN_DIR, self.VEC_TE_DIR]:
             os.makedirs(directory, exist_ok=True)
         
-        # BERT initialization
-        self.tokenizer = BertTokenizer.from_pretrained('bert-base-multilingual-cased')
-        self.model = BertModel.from_pretrained('bert-base-multilingual-cased')
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.model.to(self.device)
+        # Shared BERT encoder, loaded on first use
+        self.encoder = get_encoder()
         
         # Dimensions and parameters
         self.bert_dimension = 768
         self.ri_dimension = dimension
         self.nonzeros = nonzeros
         self.delta = delta
+
+        # Scoring parameters
+        self.bert_weight = 0.7
+        self.ri_weight = 0.3
+        self.threshold = 0.05
         
         # Load vocabularies
         self._load_vocabularies()
+        self._refresh_vocabularies()
+
+        # Cache of query embeddings
+        self.query_cache = QueryEmbeddingCache(
+            maxsize=query_cache_size,
+            ttl=query_cache_ttl,
+            directory=query_cache_dir or os.getenv("QUERY_CACHE_DIR")
+        )
 
-    def find(self, query):
+        # Optional ANN candidate generation
+        self.ann_backend = ann_backend or os.getenv("ANN_BACKEND")
+        self.ann_params = json.loads(os.getenv("ANN_PARAMS", "{}")) if ann_params is None else ann_params
+        self.ann_candidates = ann_candidates
+
+        # Note embeddings written by IndexerAPI
+        self.STORE_DIRECTORY = os.path.join(self.EMBEDDINGS_DIRECTORY, "store")
+        self.RI_PROJECTION_PATH = os.path.join(self.STORE_DIRECTORY, "ri_projection.npz")
+        self.store = None
+        self._refresh_projection()
+
+        # Per-window vectors, present if the indexer keeps them
+        self.CHUNK_STORE_DIRECTORY = os.path.join(self.EMBEDDINGS_DIRECTORY, "chunks")
+        self.chunk_store = None
+        self.chunk_overlap = chunk_overlap
+
+        # Inverted index written by IndexerAPI, opened on first use
+        self.LEXICAL_DIRECTORY = os.path.join(self.EMBEDDINGS_DIRECTORY, "lexical")
+        self.lexical = None
+        self.lexical_weight = lexical_weight
+        self.lexical_candidates = lexical_candidates
+
+
+    def find(self, query, top_k=3):
         try:
             processed_query = self._process_query(query)
             print(f"Processing query: '{processed_query}'")
             
-            bert_query_emb = self._compute_bert_embedding(processed_query)
-            ri_query_emb = self._compute_ri_embedding(processed_query)
+            bert_query_emb, ri_query_emb = self._query_embeddings(processed_query)
             
-            results = self._compute_similarities(bert_query_emb, ri_query_emb)
+            results = self._compute_similarities(bert_query_emb, ri_query_emb, processed_query)
             
-            if not results:
+            if not len(results[0]):
                 print("No matching results found.")
                 return []
             
-            return self._get_top_results(results)
+            return self._get_top_results(results, top_k)
             
         except Exception as e:
             print(f"Error in find method: {str(e)}")
             raise
 
+    def find_keywords(self, query, top_k=3):
+        """Notes ranked by BM25 alone, without running BERT. Similarity is the BM25 score."""
+        lexical = self._lexical_index()
+        if lexical is None:
+            print("No lexical index found; index notes with IndexerAPI first.")
+            return []
+        processed_query = self._process_query(query)
+        results = []
+        for doc_name, score in lexical.top(processed_query, top_k):
+            note_path = os.path.join(self.NOTES_DIRECTORY, f"{doc_name}.txt")
+            if os.path.exists(note_path):
+                with open(note_path, 'r', encoding='utf-8') as file:
+                    results.append({
+                        'note_id': doc_name,
+                        'similarity': float(score),
+                        'content': file.read()
+                    })
+        return results
+
+    def _lexical_index(self):
+        """The BM25 index with the indexer's latest updates, or None if there is none"""
+        if self.lexical is None:
+            if not os.path.exists(os.path.join(self.LEXICAL_DIRECTORY, "meta.json")):
+                return None
+            self.lexical = LexicalIndex(self.LEXICAL_DIRECTORY)
+        self.lexical.refresh()
+        return self.lexical
+
+    def find_passages(self, query, top_k=3):
+        """Best matching windows of long notes, scored by BERT similarity alone"""
+        if self.chunk_store is None:
+            if not os.path.exists(os.path.join(self.CHUNK_STORE_DIRECTORY, "meta.json")):
+                print("No passage embeddings found; index with keep_chunks=True first.")
+                return []
+            self.chunk_store = EmbeddingStore(self.CHUNK_STORE_DIRECTORY, {'bert': self.bert_dimension})
+        store = self.chunk_store
+        store.refresh()
+
+        processed_query = self._process_query(query)
+        bert_query_emb, _ = self._query_embeddings(processed_query)
+        bert_query = normalize_rows(np.nan_to_num(bert_query_emb)).reshape(-1)
+
+        rows = np.flatnonzero(store.live_mask())
+        scores = np.asarray(store.matrix('bert')[rows]) @ bert_query
+        if top_k <= 0 or not len(rows):
+            return []
+        if len(scores) > top_k:
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind='stable')]
+
+        results = []
+        for row, similarity in zip(rows[top], scores[top]):
+            doc_name = store.ids[row]
+            chunk = int(row - store.rows_for(doc_name)[0])
+            note_path = os.path.join(self.NOTES_DIRECTORY, f"{doc_name}.txt")
+            if os.path.exists(note_path):
+                with open(note_path, 'r', encoding='utf-8') as file:
+                    content = file.read()
+                results.append({
+                    'note_id': doc_name,
+                    'chunk': chunk,
+                    'similarity': float(similarity),
+                    'passage': self.encoder.passage(content, chunk, overlap=self.chunk_overlap)
+                })
+        return results
+
     def _get_top_results(self, similarities, top_k=3):
-        sorted_docs = sorted(similarities.items(), key=lambda x: x[1], reverse=True)
+        """Return the top_k notes of the (rows, scores) pair from _compute_similarities"""
+        rows, scores = similarities
+        if top_k <= 0:
+            return []
+        if len(scores) > top_k:
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind='stable')]
         results = []
         
-        for doc_name, similarity in sorted_docs[:top_k]:
+        for row, similarity in zip(rows[top], scores[top]):
+            doc_name = self.store.ids[row]
             note_path = os.path.join(self.NOTES_DIRECTORY, f"{doc_name}.txt")
             if os.path.exists(note_path):
                 with open(note_path, 'r', encoding='utf-8') as file:
                     content = file.read()
                     results.append({
                         'note_id': doc_name,
-                        'similarity': similarity,
+                        'similarity': float(similarity),
                         'content': content
                     })
         return results
 
+    def _query_embeddings(self, processed_query):
+        """BERT and RI embeddings of a processed query, served from the cache when possible"""
+        self._refresh_vocabularies()
+        self._refresh_projection()
+        current_version = f"{self.vocab_version}:{self.projection_version}"
+        cached = self.query_cache.get(processed_query)
+        if cached is not None:
+            bert_query_emb, ri_query_emb, ri_version = cached
+            if ri_version == current_version:
+                return bert_query_emb, ri_query_emb
+        else:
+            bert_query_emb = self._compute_bert_embedding(processed_query)
+        # New query, or the RI vocabularies or projection changed since it was cached
+        ri_query_emb = self._compute_ri_embedding(processed_query)
+        if self.ri_projection is not None:
+            ri_query_emb = normalize_rows(self.ri_projection.project(ri_query_emb))
+        self.query_cache.put(processed_query, bert_query_emb, ri_query_emb, current_version)
+        return bert_query_emb, ri_query_emb
+
+    def _refresh_projection(self):
+        """Reopen the store and ANN index if IndexerAPI.reduce_ri changed the RI projection"""
+        try:
+            version = str(os.stat(self.RI_PROJECTION_PATH).st_mtime_ns)
+        except FileNotFoundError:
+            version = '0'
+        if self.store is not None and version == self.projection_version:
+            return
+        self.ri_projection = SVDProjection.load(self.RI_PROJECTION_PATH) if version != '0' else None
+        # Only IndexerAPI creates the store; until it has, there are no notes to score
+        self.store = EmbeddingStore.open(self.STORE_DIRECTORY)
+        # Normalised document matrices, rebuilt when the store changes
+        self._resident_version = None
+        self.ann = NoteAnnIndex(self.store, self.ann_backend, self.ann_params, read_only=True) if self.ann_backend and self.store is not None else None
+        self.projection_version = version
+
     def _compute_bert_embedding(self, text):
-        inputs = self.tokenizer(
-            text,
-            return_tensors="pt",
-            padding=True,
-            truncation=True,
-            max_length=512
-        ).to(self.device)
-        
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            # Use pooler_output for consistent dimensionality
-            embedding = outputs.pooler_output.cpu().numpy()
-            return embedding.reshape(1, self.bert_dimension)
+        embedding = self.encoder.encode([text])
+        return embedding.reshape(1, self.bert_dimension)
 
     def _compute_ri_embedding(self, text):
         """Compute RI embeddings separately for English and Telugu"""
@@ -100,15 +261,13 @@ class RetrievalAPI:
         en_vector = np.zeros(self.ri_dimension)
         for word in en_words:
             if word in self.en_vocab:
-                idx = self.en_vocab[word][0]
-                en_vector += self.en_vectors[idx]
+                en_vector += self.en_vocab.vector(word)
         
         # Compute Telugu embedding
         te_vector = np.zeros(self.ri_dimension)
         for word in te_words:
             if word in self.te_vocab:
-                idx = self.te_vocab[word][0]
-                te_vector += self.te_vectors[idx]
+                te_vector += self.te_vocab.vector(word)
         
         # Combine vectors
         combined_vector = en_vector + te_vector
@@ -118,59 +277,68 @@ class RetrievalAPI:
         return combined_vector.reshape(1, self.ri_dimension)
 
 
-    def _compute_similarities(self, bert_query_emb, ri_query_emb):
-        similarities = {}
-        bert_weight = 0.7
-        ri_weight = 0.3
-
-        print(f"\nProcessing query embeddings:")
-        print(f"BERT query shape: {bert_query_emb.shape}")
-        print(f"RI query shape: {ri_query_emb.shape}")
-
-        for filename in os.listdir(self.NOTES_DIRECTORY):
-            if filename.endswith('.txt'):
-                try:
-                    doc_name = filename.replace('.txt', '')
-                    bert_path = os.path.join(self.EMBEDDINGS_DIRECTORY, f"{doc_name}_bert.npy")
-                    en_path = os.path.join(self.VEC_EN_DIR, f"{doc_name}_ri.npy")
-                    te_path = os.path.join(self.VEC_TE_DIR, f"{doc_name}_ri.npy")
-                    
-                    if all(os.path.exists(p) for p in [bert_path, en_path, te_path]):
-                        # Load embeddings
-                        bert_emb = np.load(bert_path)
-                        en_emb = np.load(en_path)
-                        te_emb = np.load(te_path)
-                        
-                        # Combine RI embeddings
-                        ri_emb = en_emb + te_emb
-                        if np.any(ri_emb):
-                            ri_emb = ri_emb / np.linalg.norm(ri_emb)
-                        
-                        # Normalize BERT embedding
-                        bert_norm = np.linalg.norm(bert_emb)
-                        if bert_norm > 0:
-                            bert_emb = bert_emb / bert_norm
-                        
-                        # Compute similarities
-                        bert_sim = cosine_similarity(bert_query_emb, bert_emb)[0][0]
-                        ri_sim = cosine_similarity(ri_query_emb, ri_emb.reshape(1, -1))[0][0]
-                        
-                        print(f"\nProcessing document: {doc_name}")
-                        print(f"BERT similarity: {bert_sim:.4f}")
-                        print(f"RI similarity: {ri_sim:.4f}")
-                        
-                        # Combine similarities
-                        combined_sim = bert_weight * bert_sim + ri_weight * ri_sim
-                        
-                        if combined_sim > 0.05:
-                            similarities[doc_name] = combined_sim
-                            print(f"Match found! Combined similarity: {combined_sim:.4f}")
-                    
-                except Exception as e:
-                    print(f"Error processing {filename}: {str(e)}")
-                    continue
-
-        return similarities
+    def _resident_matrices(self):
+        """Live store rows with their normalised BERT and combined RI matrices"""
+        self.store.refresh()
+        if self._resident_version != self.store.version:
+            live = np.flatnonzero(self.store.live_mask())
+            bert_matrix = np.array(self.store.matrix('bert')[live], dtype=np.float32)
+            ri_matrix = np.asarray(self.store.matrix('ri_en')[live]) + np.asarray(self.store.matrix('ri_te')[live])
+            for matrix in (bert_matrix, ri_matrix):
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                np.divide(matrix, norms, out=matrix, where=norms > 0)
+            self._resident = (live, bert_matrix, ri_matrix)
+            self._resident_version = self.store.version
+        return self._resident
+
+    def _candidate_matrices(self, rows):
+        """Candidate rows with their normalised matrices"""
+        bert_matrix = normalize_rows(self.store.matrix('bert')[rows])
+        ri_matrix = normalize_rows(np.asarray(self.store.matrix('ri_en')[rows]) + np.asarray(self.store.matrix('ri_te')[rows]))
+        return rows, bert_matrix, ri_matrix
+
+    def _compute_similarities(self, bert_query_emb, ri_query_emb, processed_query=None):
+        """Score live notes; returns (rows, scores) of notes above the threshold"""
+        bert_query = np.nan_to_num(np.asarray(bert_query_emb, dtype=np.float32).reshape(-1))
+        bert_norm = np.linalg.norm(bert_query)
+        if bert_norm > 0:
+            bert_query = bert_query / bert_norm
+        ri_query = np.asarray(ri_query_emb, dtype=np.float32).reshape(-1)
+        if self.store is None:
+            print("No notes indexed yet")
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        lexical_scores = {}
+        if processed_query is not None and (self.lexical_weight or self.lexical_candidates):
+            lexical = self._lexical_index()
+            if lexical is not None:
+                lexical_scores = lexical.scores(processed_query)
+        self.store.refresh()
+
+        candidates = []
+        if self.lexical_candidates and lexical_scores:
+            best = sorted(lexical_scores, key=lexical_scores.get, reverse=True)[:self.lexical_candidates]
+            candidates.append(np.array([row for note_id in best for row in self.store.rows_for(note_id)], dtype=np.int64))
+        # Fall back to the exhaustive scan while there is no usable ANN index
+        if self.ann and self.ann.refresh():
+            candidates.append(self.ann.candidates(bert_query, ri_query, self.ann_candidates))
+        if candidates:
+            rows, bert_matrix, ri_matrix = self._candidate_matrices(np.unique(np.concatenate(candidates)))
+        else:
+            rows, bert_matrix, ri_matrix = self._resident_matrices()
+
+        scores = self.bert_weight * (bert_matrix @ bert_query) + self.ri_weight * (ri_matrix @ ri_query)
+        if self.lexical_weight and lexical_scores:
+            # rows is sorted, so the rows of the matching notes are found by bisection
+            hits = [(row, score) for note_id, score in lexical_scores.items() for row in self.store.rows_for(note_id)]
+            hit_rows = np.array([row for row, _ in hits], dtype=np.int64)
+            positions = np.minimum(np.searchsorted(rows, hit_rows), max(len(rows) - 1, 0))
+            found = rows[positions] == hit_rows if len(rows) else np.zeros(len(hits), dtype=bool)
+            hit_scores = np.array([score for _, score in hits])
+            np.add.at(scores, positions[found], self.lexical_weight * hit_scores[found] / max(lexical_scores.values()))
+        matches = scores > self.threshold
+        print(f"Scored {len(rows)} notes, {int(matches.sum())} above threshold {self.threshold}")
+        return rows[matches], scores[matches]
 
 
     def _process_query(self, query):
@@ -183,23 +351,13 @@ class RetrievalAPI:
         
         
     
+    def _refresh_vocabularies(self):
+        """Pick up vocabulary changes IndexerAPI saved since they were loaded"""
+        self.en_vocab.refresh()
+        self.te_vocab.refresh()
+        self.vocab_version = f"{self.en_vocab.version}:{self.te_vocab.version}"
+
     def _load_vocabularies(self):
-        """Load existing vocabularies"""
-        self.en_vocab = {}
-        self.te_vocab = {}
-        self.en_vectors = []
-        self.te_vectors = []
-        
-        # Load English vocabulary
-        en_path = os.path.join(self.VEC_EN_DIR, "vocab.npz")
-        if os.path.exists(en_path):
-            data = np.load(en_path, allow_pickle=True)
-            self.en_vocab = data['vocab'].item()
-            self.en_vectors = data['vectors']
-            
-        # Load Telugu vocabulary
-        te_path = os.path.join(self.VEC_TE_DIR, "vocab.npz")
-        if os.path.exists(te_path):
-            data = np.load(te_path, allow_pickle=True)
-            self.te_vocab = data['vocab'].item()
-            self.te_vectors = data['vectors']
\ No newline at end of file
+        """Open the vocabulary stores IndexerAPI writes, read-only"""
+        self.en_vocab = VocabularyStore(os.path.join(self.VEC_EN_DIR, "vocab"), self.ri_dimension, read_only=True)
+        self.te_vocab = VocabularyStore(os.path.join(self.VEC_TE_DIR, "vocab"), self.ri_dimension, read_only=True)
@@ -4,6 +4,10 @@
 # cleaning up October 2017
 ####################################
 import math
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import numpy.random as nprnd
 from collections import Counter
@@ -48,7 +52,7 @@ def get_vec(wrd, vocab, distvecs):
 # Core functions
 ####################################
 
-def dsm(infile, win=2, trainfunc='direction', indexfunc='legacy', dimen=2000, nonzeros=8, delta=60, theta=0.5, use_rivecs=False, use_weights=True):
+def dsm(infile, win=2, trainfunc='direction', indexfunc='legacy', dimen=2000, nonzeros=8, delta=60, theta=0.5, use_rivecs=False, use_weights=True, batched=True, chunk_tokens=100000, workers=1, seed=None):
     """
     Python implementation of Random Indexing
 
@@ -72,8 +76,27 @@ def dsm(infile, win=2, trainfunc='direction', indexfunc='legacy', dimen=2000, no
     There are two additional flags:
     use_rivecs: use precompiled ri vectors (produced with the function make_ri_vecs())
     use_weights: use incremental frequency weights (default: True)
+
+    With batched (default: True) 'window' and 'direction' training runs on
+    integer-encoded chunks of about chunk_tokens tokens with vectorized
+    updates (see update_vecs_batched) into an RIModel. The vectors are then
+    a float32 (types, dimen) array and the random indices a
+    (types, nonzeros, 2) array, and otherwise behave like the lists of the
+    token-by-token loop.
+    With workers > 1 batched training is split over that many processes, see
+    dsm_parallel. With a seed, batched training derives every word's random
+    index from the word and the seed (see hashed_index), so they can be
+    recomputed instead of stored.
     """
+    if batched and workers > 1 and trainfunc != 'ngrams' and not use_rivecs:
+        return dsm_parallel(infile, win, trainfunc, indexfunc, dimen, nonzeros, delta, use_weights, workers, chunk_tokens=chunk_tokens, seed=seed)
     print("Started: " + strftime("%H:%M:%S", gmtime()))
+    if batched and trainfunc != 'ngrams' and not use_rivecs:
+        model, tokens = dsm_batched(infile, win, trainfunc, indexfunc, dimen, nonzeros, delta, use_weights, chunk_tokens, seed)
+        print("Number of word tokens: " + str(tokens))
+        print("Number of word types: " + str(len(model)))
+        print("Finished: " + strftime("%H:%M:%S", gmtime()))
+        return model.distvecs, model.rivecs, model.legacy_vocab()
     tokens = 0
     types = 0
     ngrams = 0
@@ -138,6 +161,375 @@ def update_vecs(wrdlst, win, dimen, nonzeros, delta, tokens, types, vocab, rivec
     else:
         return localtoken, types, distvecs, rivecs, vocab
 
+####################################
+# Batched training
+####################################
+
+class RIModel:
+    """
+    Array-backed Random Indexing model
+
+    Row i of every array belongs to the word with vocab[word] == i:
+    - index: int32 (rows, nonzeros) positions of the non-zero random index elements
+    - sign: int8 (rows, nonzeros) signs of those elements
+    - vectors: float32 (rows, dimen) distributional vectors
+    - freqs: int64 (rows,) focus frequencies
+    Capacity doubles when the vocabulary outgrows it, and random indices for
+    new words are drawn in one block per call to add(). With a seed they are
+    hashed from the words instead of drawn from numpy.random.
+
+    The model is also a streaming trainer: partial_fit() continues 'window' or
+    'direction' training (win, delta and use_weights as in dsm) on more text,
+    exactly as if it had been appended to everything seen before, and
+    checkpoint() / RIModel.resume() save and restore the whole state.
+    """
+
+    def __init__(self, dimen=2000, nonzeros=8, indexfunc='legacy', capacity=1024, seed=None,
+                 win=2, trainfunc='direction', delta=60, use_weights=True):
+        if trainfunc not in ('window', 'direction'):
+            raise ValueError(f"RIModel supports 'window' and 'direction' training, not '{trainfunc}'")
+        self.dimen = dimen
+        self.nonzeros = 2 if indexfunc == 'verysparse' else nonzeros
+        self.indexfunc = indexfunc
+        self.seed = seed
+        self.win = win
+        self.trainfunc = trainfunc
+        self.delta = delta
+        self.use_weights = use_weights
+        self.tokens = 0
+        self.meta = {}
+        self.vocab = {}
+        self.index = np.zeros((capacity, self.nonzeros), dtype=np.int32)
+        self.sign = np.zeros((capacity, self.nonzeros), dtype=np.int8)
+        self.vectors = np.zeros((capacity, dimen), dtype=np.float32)
+        self.freqs = np.zeros(capacity, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.vocab)
+
+    def _grow(self, rows):
+        capacity = len(self.freqs)
+        if rows <= capacity:
+            return
+        while capacity < rows:
+            capacity *= 2
+        for name in ('index', 'sign', 'vectors', 'freqs'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def add(self, words):
+        """Give every unseen word in words (in order) a row and a random index"""
+        start = len(self.vocab)
+        new = []
+        for w in words:
+            if w not in self.vocab:
+                self.vocab[w] = len(self.vocab)
+                new.append(w)
+        count = len(new)
+        if count:
+            self._grow(len(self.vocab))
+            if self.seed is not None:
+                index, sign = hashed_index(new, self.dimen, self.nonzeros, self.seed, self.indexfunc)
+            elif self.indexfunc == 'verysparse':
+                index, sign = make_very_sparse_index_block(count, self.dimen)
+            else:
+                index, sign = make_index_block(count, self.dimen, self.nonzeros)
+            self.index[start:start + count] = index
+            self.sign[start:start + count] = sign
+        return count
+
+    def partial_fit(self, lines, chunk_tokens=100000):
+        """
+        Train on an iterable of lines (strings or token lists), one sentence per line
+
+        Lines are integer-encoded and handed to update_vecs_batched in chunks of
+        about chunk_tokens tokens. New words get their rows in order of first
+        occurrence, just like check_reps. Returns the number of tokens.
+        """
+        pi = 0 if self.trainfunc == 'window' else 1
+        tokens = 0
+        chunk = []
+        chunk_size = 0
+
+        def flush():
+            words = [w for wrdlst in chunk for w in wrdlst]
+            self.add(words)
+            types = len(self)
+            tok = np.fromiter((self.vocab[w] for w in words), dtype=np.int64, count=len(words))
+            lengths = np.fromiter((len(wrdlst) for wrdlst in chunk), dtype=np.int64, count=len(chunk))
+            update_vecs_batched(tok, lengths, self.win, pi, self.delta, self.freqs[:types], self.index[:types],
+                                self.sign[:types], self.vectors[:types], self.use_weights)
+            chunk.clear()
+
+        for line in lines:
+            wrdlst = line.strip().split() if isinstance(line, str) else list(line)
+            chunk.append(wrdlst)
+            tokens += len(wrdlst)
+            chunk_size += len(wrdlst)
+            if chunk_size >= chunk_tokens:
+                flush()
+                chunk_size = 0
+        if chunk:
+            flush()
+        self.tokens += tokens
+        return tokens
+
+    def checkpoint(self, path):
+        """Save the full training state to path (.npz), replacing it atomically"""
+        n = len(self)
+        params = {
+            'dimen': self.dimen, 'nonzeros': self.nonzeros, 'indexfunc': self.indexfunc, 'seed': self.seed,
+            'win': self.win, 'trainfunc': self.trainfunc, 'delta': self.delta, 'use_weights': self.use_weights,
+            'tokens': self.tokens, 'meta': self.meta
+        }
+        arrays = {
+            'words': np.array(list(self.vocab), dtype=str),
+            'freqs': self.freqs[:n],
+            'vectors': self.vectors[:n]
+        }
+        # Hashed indices are recomputed on resume
+        if self.seed is None:
+            arrays['index'] = self.index[:n]
+            arrays['sign'] = self.sign[:n]
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, params=json.dumps(params), **arrays)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def resume(cls, path):
+        """Load a model saved with checkpoint()"""
+        with np.load(path) as data:
+            params = json.loads(str(data['params']))
+            tokens = params.pop('tokens')
+            meta = params.pop('meta')
+            words = data['words'].tolist()
+            n = len(words)
+            model = cls(capacity=max(1024, n), **params)
+            model.vocab = dict(zip(words, range(n)))
+            model.freqs[:n] = data['freqs']
+            model.vectors[:n] = data['vectors']
+            if model.seed is None:
+                model.index[:n] = data['index']
+                model.sign[:n] = data['sign']
+            elif n:
+                model.index[:n], model.sign[:n] = hashed_index(words, model.dimen, model.nonzeros, model.seed, model.indexfunc)
+        model.tokens = tokens
+        model.meta = meta
+        return model
+
+    @property
+    def distvecs(self):
+        return self.vectors[:len(self.vocab)]
+
+    @property
+    def rivecs(self):
+        """Random indices in the (rows, nonzeros, 2) [position, sign] layout of make_index"""
+        return np.stack([self.index[:len(self.vocab)], self.sign[:len(self.vocab)]], axis=2)
+
+    def legacy_vocab(self):
+        """The word -> [row, frequency] dictionary used by the rest of this module"""
+        return {w: [row, int(self.freqs[row])] for w, row in self.vocab.items()}
+
+def dsm_batched(infile, win, trainfunc, indexfunc, dimen, nonzeros, delta, use_weights, chunk_tokens, seed=None):
+    """
+    Vectorized equivalent of the update_vecs loop over infile
+
+    Returns the trained RIModel and the number of tokens.
+    """
+    model = RIModel(dimen, nonzeros, indexfunc, seed=seed, win=win, trainfunc=trainfunc, delta=delta, use_weights=use_weights)
+    with open(infile, "r") as inp:
+        tokens = model.partial_fit(inp, chunk_tokens)
+    return model, tokens
+
+def update_vecs_batched(tok, lengths, win, pi, delta, counts, ri_index, ri_sign, distvecs, use_weights, static_weights=None):
+    """
+    Apply update_vecs to a chunk of integer-encoded lines at once
+
+    tok holds the word ids of the chunk, lengths the number of tokens per line.
+    counts (focus frequency per word id, updated in place) and distvecs
+    (updated in place) carry the state between chunks; ri_index and ri_sign
+    are the (types, nonzeros) random index columns and signs.
+
+    The loop weights the pair (w at p, c at p+l) with the frequencies and the
+    number of types it has seen at that moment:
+    - freq(w) is the number of occurrences of w up to p,
+    - freq(c) the number of occurrences of c up to p,
+    - types the number of distinct words up to the furthest position looked
+      at so far, which is p+l, or p+win-1 (capped at the line end) if the
+      previous focus word was on the same line.
+    All of these follow from running occurrence counts over the chunk.
+    static_weights (one weight per word id) replaces these incremental weights.
+    """
+    n = len(tok)
+    if n == 0:
+        return
+    # Running occurrence number of every token, continuing from earlier chunks
+    order = np.argsort(tok, kind='stable')
+    sorted_tok = tok[order]
+    group_start = np.flatnonzero(np.r_[True, sorted_tok[1:] != sorted_tok[:-1]])
+    rank = np.arange(n) - np.repeat(group_start, np.diff(np.r_[group_start, n]))
+    occ = np.empty(n, dtype=np.int64)
+    occ[order] = counts[sorted_tok] + rank + 1
+    # Number of distinct words seen up to and including each position
+    types_before = int(np.count_nonzero(counts))
+    distinct = types_before + np.cumsum(occ == 1)
+
+    line_start = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    line_end = line_start + np.repeat(lengths, lengths)
+    positions = np.arange(n)
+    horizon = np.where(positions == line_start, positions, np.minimum(positions + win - 1, line_end - 1))
+
+    rows = []
+    cols = []
+    vals = []
+    for l in range(1, win + 1):
+        p = positions[positions + l < line_end]
+        q = p + l
+        w = tok[p]
+        c = tok[q]
+        if static_weights is not None:
+            weight_c = static_weights[c]
+            weight_w = static_weights[w]
+        elif use_weights:
+            between = np.zeros(len(p), dtype=np.int64)
+            for j in range(1, l):
+                between += tok[p + j] == c
+            types = distinct[np.maximum(q, horizon[p])]
+            weight_c = np.exp(-delta * ((occ[q] - 1 - between) / types))
+            weight_w = np.exp(-delta * (occ[p] / types))
+        else:
+            weight_c = weight_w = np.ones(len(p))
+        rows.append(np.repeat(w, ri_index.shape[1]))
+        cols.append((ri_index[c].astype(np.int64) + pi).ravel())
+        vals.append((ri_sign[c] * weight_c[:, None]).ravel())
+        rows.append(np.repeat(c, ri_index.shape[1]))
+        cols.append((ri_index[w].astype(np.int64) - pi).ravel())
+        vals.append((ri_sign[w] * weight_w[:, None]).ravel())
+
+    # One scatter-add for the whole chunk; the modulo wraps permuted
+    # column -1 to the last column, as negative indexing does in the loop
+    dimen = distvecs.shape[1]
+    flat = np.concatenate(rows) * dimen + np.concatenate(cols) % dimen
+    np.add.at(distvecs.reshape(-1), flat, np.concatenate(vals).astype(distvecs.dtype))
+    counts += np.bincount(tok, minlength=len(counts))
+
+####################################
+# Parallel training
+####################################
+
+def dsm_parallel(infile, win=2, trainfunc='direction', indexfunc='legacy', dimen=2000, nonzeros=8, delta=60, use_weights=True, workers=None, shards=None, chunk_tokens=100000, seed=None):
+    """
+    Random Indexing trained on byte-range shards of infile in worker processes
+
+    Context vectors are sums of independent contributions, so shards can be
+    trained separately and their distributional matrices added up. A first
+    parallel pass counts every word; the vocabulary (in order of first
+    occurrence) and the random index table are then fixed before training,
+    so all shards agree on them.
+
+    The incremental frequency weight depends on the order tokens are seen in,
+    which shards do not share. In this mode every word instead gets the static
+    weight weight_func(total frequency, number of types, delta), i.e. the
+    weight it would end the sequential run with.
+
+    Returns the same (distvecs, rivecs, vocab) as dsm. shards defaults to
+    workers; each shard sends back one full (types, dimen) float32 matrix.
+    """
+    print("Started: " + strftime("%H:%M:%S", gmtime()))
+    workers = workers or os.cpu_count()
+    ranges = shard_offsets(infile, shards or workers)
+    with ProcessPoolExecutor(workers) as pool:
+        counters = list(pool.map(count_shard, [infile] * len(ranges), *zip(*ranges)))
+    # Merging in shard order keeps the words in order of first occurrence
+    freqs = {}
+    for counter in counters:
+        for w, freq in counter.items():
+            freqs[w] = freqs.get(w, 0) + freq
+
+    model = RIModel(dimen, nonzeros, indexfunc, capacity=max(1, len(freqs)), seed=seed)
+    model.add(freqs)
+    types = len(model)
+    model.freqs[:types] = list(freqs.values())
+    weights = np.exp(-delta * (model.freqs[:types] / types)) if use_weights else np.ones(types)
+
+    pi = 0 if trainfunc == 'window' else 1
+    tokens = 0
+    distvecs = model.vectors[:types]
+    initargs = (dimen, model.vocab, model.index[:types], model.sign[:types], weights)
+    with ProcessPoolExecutor(workers, initializer=init_shard_worker, initargs=initargs) as pool:
+        jobs = [pool.submit(train_shard, infile, start, end, win, pi, chunk_tokens) for start, end in ranges]
+        for job in jobs:
+            partial, shard_tokens = job.result()
+            distvecs += partial
+            tokens += shard_tokens
+    print("Number of word tokens: " + str(tokens))
+    print("Number of word types: " + str(types))
+    print("Finished: " + strftime("%H:%M:%S", gmtime()))
+    return model.distvecs, model.rivecs, model.legacy_vocab()
+
+def shard_offsets(infile, shards):
+    """Split infile into shards (start, end) byte ranges that begin at line starts"""
+    size = os.path.getsize(infile)
+    offsets = [0]
+    with open(infile, "rb") as inp:
+        for i in range(1, shards):
+            inp.seek(max(size * i // shards, offsets[-1]))
+            if inp.tell() > 0:
+                inp.seek(inp.tell() - 1)
+                inp.readline()
+            offsets.append(inp.tell())
+    offsets.append(size)
+    return [(start, end) for start, end in zip(offsets[:-1], offsets[1:]) if end > start]
+
+def read_shard(infile, start, end):
+    """Yield the token lists of the lines of infile that start in [start, end)"""
+    with open(infile, "rb") as inp:
+        inp.seek(start)
+        while inp.tell() < end:
+            line = inp.readline()
+            if not line:
+                break
+            yield line.decode("utf-8").strip().split()
+
+def count_shard(infile, start, end):
+    counter = Counter()
+    for wrdlst in read_shard(infile, start, end):
+        counter.update(wrdlst)
+    return counter
+
+shard_state = None
+def init_shard_worker(dimen, vocab, ri_index, ri_sign, weights):
+    global shard_state
+    shard_state = (dimen, vocab, ri_index, ri_sign, weights)
+
+def train_shard(infile, start, end, win, pi, chunk_tokens):
+    """Partial distributional matrix of one shard, using the table set by init_shard_worker"""
+    dimen, vocab, ri_index, ri_sign, weights = shard_state
+    distvecs = np.zeros((len(vocab), dimen), dtype=np.float32)
+    counts = np.zeros(len(vocab), dtype=np.int64)
+    tokens = 0
+    lines = []
+
+    def flush():
+        tok = np.fromiter((vocab[w] for wrdlst in lines for w in wrdlst), dtype=np.int64)
+        lengths = np.fromiter((len(wrdlst) for wrdlst in lines), dtype=np.int64, count=len(lines))
+        update_vecs_batched(tok, lengths, win, pi, 0, counts, ri_index, ri_sign, distvecs, True, static_weights=weights)
+        lines.clear()
+
+    chunk_size = 0
+    for wrdlst in read_shard(infile, start, end):
+        lines.append(wrdlst)
+        tokens += len(wrdlst)
+        chunk_size += len(wrdlst)
+        if chunk_size >= chunk_tokens:
+            flush()
+            chunk_size = 0
+    if lines:
+        flush()
+    return distvecs, tokens
+
 def make_index(dimen, nonzeros):
     ret = []
     inds = nprnd.randint(dimen-2, size=nonzeros) # dimen-2 to facilitate directional permutation
@@ -153,12 +545,62 @@ def make_very_sparse_index(dimen):
     global verysparsecounter
     ret = []
     ret.append([verysparsecounter,nprnd.randint(0,2)*2-1])
-    ret.append([nprnd.randint(dimen-2, size=1)+1, nprnd.randint(0,2)*2-1]) # dimen-2 and +1 to facilitate directional permutation
+    ret.append([nprnd.randint(dimen-2)+1, nprnd.randint(0,2)*2-1]) # dimen-2 and +1 to facilitate directional permutation
     verysparsecounter += 1
     if verysparsecounter == (dimen-2):
         verysparsecounter = 0
     return np.array(ret)
 
+def make_index_block(count, dimen, nonzeros):
+    """Random indices for count words at once, as int32 positions and int8 signs"""
+    inds = nprnd.randint(dimen-2, size=(count, nonzeros)).astype(np.int32) + 1 # same range as make_index
+    signs = (nprnd.randint(0, 2, size=(count, nonzeros)) * 2 - 1).astype(np.int8)
+    return inds, signs
+
+def make_very_sparse_index_block(count, dimen):
+    """make_very_sparse_index for count words at once"""
+    global verysparsecounter
+    inds = np.empty((count, 2), dtype=np.int32)
+    inds[:,0] = (verysparsecounter + np.arange(count)) % (dimen-2)
+    inds[:,1] = nprnd.randint(dimen-2, size=count) + 1
+    signs = (nprnd.randint(0, 2, size=(count, 2)) * 2 - 1).astype(np.int8)
+    verysparsecounter = (verysparsecounter + count) % (dimen-2)
+    return inds, signs
+
+def word_hashes(words, seed=0):
+    """Stable 64-bit hash of every word under seed, independent of process and run"""
+    key = (int(seed) & 0xFFFFFFFFFFFFFFFF).to_bytes(8, 'little')
+    return np.fromiter((int.from_bytes(hashlib.blake2b(w.encode('utf-8'), digest_size=8, key=key).digest(), 'little') for w in words),
+                       dtype=np.uint64, count=len(words))
+
+def splitmix64(x):
+    """Element-wise splitmix64 mixing of a uint64 array"""
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+def hashed_index(words, dimen, nonzeros, seed=0, indexfunc='legacy'):
+    """
+    Random indices for words derived from their hashes under seed
+
+    Same layout and value ranges as make_index_block ('legacy') or
+    make_very_sparse_index_block ('verysparse'; the controlled element is
+    hashed too, as there is no shared counter), but the same word always gets
+    the same index for the same seed.
+    """
+    if indexfunc == 'verysparse':
+        nonzeros = 2
+    hashes = word_hashes(words, seed)
+    # Element k of a word is the k-th splitmix64 output seeded with its hash
+    states = hashes[:, None] + np.uint64(0x9E3779B97F4A7C15) * np.arange(nonzeros, dtype=np.uint64)
+    mixed = splitmix64(states)
+    inds = (mixed % np.uint64(dimen-2)).astype(np.int32) + 1
+    if indexfunc == 'verysparse':
+        inds[:,0] -= 1 # the controlled element of make_very_sparse_index is not shifted
+    signs = ((mixed >> np.uint64(63)).astype(np.int8) * 2 - 1)
+    return inds, signs
+
 def make_ri_vecs(nr, dimen, nonzeros):
     rivecs = []
     cnt = 0
@@ -276,22 +718,152 @@ def get_ngrams(vocab):
 def weight_func(freq, words, delta):
     return math.exp(-delta*(freq/words))
 
+def row_blocks(rows, chunk_rows=None):
+    """Slices covering rows in blocks of chunk_rows (all at once if None)"""
+    step = chunk_rows or max(rows, 1)
+    return [slice(start, min(start + step, rows)) for start in range(0, rows, step)]
+
+def as_matrix(model):
+    """model as a 2-D array; lists of row vectors are stacked into a copy"""
+    if isinstance(model, np.ndarray):
+        return model
+    return np.array(model, dtype=np.result_type(*model) if len(model) else np.float64, ndmin=2)
+
+def write_back(model, matrix):
+    """Copy rows of matrix back into a list model; arrays were changed in place"""
+    if matrix is not model:
+        for cnt in range(len(model)):
+            model[cnt] = matrix[cnt]
+    return model
+
 # remove centroid
 # Sahlgren et al. (2016) The Gavagai Living Lexicon, LREC
-def remove_centroid(model):
-    tmpmat = np.asmatrix(model)
-    sumvec = np.sum(tmpmat, axis=0)
-    sumnorm = sumvec / np.linalg.norm(sumvec)
-    cnt = 0
-    for d in model:
-        model[cnt] = np.subtract(d, (np.multiply(d, sumnorm) / np.linalg.norm(sumnorm)))
-        cnt += 1
+def remove_centroid(model, chunk_rows=None):
+    """
+    Scale every vector element-wise by (1 - c), c being the normalised sum of all vectors
+
+    Arrays (including np.memmap models opened 'r+') are changed in place and
+    stay in their dtype, so float32 models are processed in float32; the sum
+    is accumulated in float64. chunk_rows bounds the memory used at once.
+    Returns model.
+    """
+    matrix = as_matrix(model)
+    sumvec = np.zeros(matrix.shape[1])
+    for block in row_blocks(len(matrix), chunk_rows):
+        sumvec += matrix[block].sum(axis=0, dtype=np.float64)
+    norm = np.linalg.norm(sumvec)
+    if norm > 0:
+        factor = (1 - sumvec / norm).astype(matrix.dtype)
+        for block in row_blocks(len(matrix), chunk_rows):
+            matrix[block] *= factor
+    return write_back(model, matrix)
+
+def normalize(model, chunk_rows=None):
+    """Scale every vector to unit length in place; zero vectors stay zero"""
+    matrix = as_matrix(model)
+    for block in row_blocks(len(matrix), chunk_rows):
+        rows = matrix[block]
+        norms = np.linalg.norm(rows, axis=1, keepdims=True)
+        np.divide(rows, norms, out=rows, where=norms > 0)
+        matrix[block] = rows
+    return write_back(model, matrix)
+
+def frequency_weight(freqs, delta):
+    """
+    Transform scaling row i by weight_func(freqs[i], len(freqs), delta)
+
+    freqs holds the frequency of every row, e.g. RIModel.freqs[:len(model)].
+    """
+    freqs = np.asarray(freqs, dtype=np.float64)
+    def apply(model, chunk_rows=None):
+        matrix = as_matrix(model)
+        for block in row_blocks(len(matrix), chunk_rows):
+            matrix[block] *= np.exp(-delta * (freqs[block] / len(freqs))).astype(matrix.dtype)[:, None]
+        return write_back(model, matrix)
+    return apply
+
+def compose(*transforms):
+    """
+    Chain post-processing transforms, e.g.
+    compose(remove_centroid, frequency_weight(freqs, 60), normalize)(model, chunk_rows=100000)
+    """
+    def apply(model, chunk_rows=None):
+        for transform in transforms:
+            model = transform(model, chunk_rows=chunk_rows)
+        return model
+    return apply
 
 def svd(model, upperdim=1000):
     tmpmat = np.asmatrix(model)
     u, s, v_t = sp.linalg.svds(tmpmat, k=upperdim, which='LM')
     return u, s
 
+class SVDProjection:
+    """
+    Projection of vectors onto the top right singular vectors of a model
+
+    fit() runs a randomized block SVD (range finder with power iterations)
+    that only reads the model in blocks of chunk_rows rows, so memory-mapped
+    models need not fit in RAM. project() maps any vectors of the model's
+    space, e.g. document or query vectors, into the reduced space.
+    """
+
+    def __init__(self, components, singular_values):
+        self.components = np.asarray(components, dtype=np.float32)
+        self.singular_values = np.asarray(singular_values, dtype=np.float32)
+
+    @property
+    def dim(self):
+        return self.components.shape[1]
+
+    @classmethod
+    def fit(cls, models, dim=256, oversample=10, iterations=2, chunk_rows=100000, seed=0):
+        """
+        Fit on one model matrix or on a list of them with the same number of columns
+
+        Every pass over the data is one product with a (columns, dim + oversample)
+        matrix per block; iterations adds power iterations for accuracy.
+        """
+        if isinstance(models, np.ndarray):
+            models = [models]
+        models = [as_matrix(model) for model in models if len(model)]
+        if not models:
+            raise ValueError("Cannot fit a projection on an empty model")
+        columns = models[0].shape[1]
+        dim = min(dim, columns)
+        width = min(dim + oversample, columns)
+
+        def gram_product(q):
+            # A^T (A q), streamed over the row blocks of every model
+            z = np.zeros((columns, q.shape[1]))
+            for model in models:
+                for block in row_blocks(len(model), chunk_rows):
+                    rows = np.asarray(model[block], dtype=np.float64)
+                    z += rows.T @ (rows @ q)
+            return z
+
+        q = np.random.default_rng(seed).standard_normal((columns, width))
+        for _ in range(iterations + 1):
+            q, _ = np.linalg.qr(gram_product(q))
+        # Eigenvectors of q^T A^T A q rotate q onto the singular vectors
+        evals, evecs = np.linalg.eigh(q.T @ gram_product(q))
+        order = np.argsort(evals)[::-1][:dim]
+        return cls(q @ evecs[:, order], np.sqrt(np.maximum(evals[order], 0)))
+
+    def project(self, vectors):
+        """vectors (..., columns) in the reduced (..., dim) space, as float32"""
+        return np.asarray(vectors, dtype=np.float32) @ self.components
+
+    def save(self, path):
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, components=self.components, singular_values=self.singular_values)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['components'], data['singular_values'])
+
 def make_ri_matrix(rivecs, dim):
     mat = np.zeros((len(rivecs), dim))
     ind = 0
@@ -318,50 +890,106 @@ def synt_sim(word1, word2, rot, synt_matrix, model, vocab):
     '''
     return 1 - st.distance.cosine(model[vocab[word1][0]], np.roll(synt_matrix[vocab[word2][0]], +rot))
 
+class NeighbourIndex:
+    """
+    Nearest-neighbour search over the rows of a model
+
+    The rows are normalised once into a float32 matrix and an index -> word
+    array replaces scans of vocab, so a query is one matrix product plus an
+    argpartition. vocab may map words to [index, frequency] or to an index.
+    With ann (a backend name from annIndex.ANN_BACKENDS, tuned by ann_params)
+    candidates come from an approximate index and are then scored exactly.
+    """
+
+    def __init__(self, model, vocab, ann=None, ann_params=None):
+        self.matrix = np.array(model, dtype=np.float32, ndmin=2)
+        norms = np.linalg.norm(self.matrix, axis=1, keepdims=True)
+        np.divide(self.matrix, norms, out=self.matrix, where=norms > 0)
+        self.words = np.empty(len(self.matrix), dtype=object)
+        self.vocab = {}
+        for w, entry in vocab.items():
+            row = entry[0] if isinstance(entry, (list, tuple)) else entry
+            self.words[row] = w
+            self.vocab[w] = row
+        self.ann = None
+        if ann:
+            from annIndex import make_ann_backend
+            self.ann = make_ann_backend(ann, self.matrix.shape[1], **(ann_params or {}))
+            self.ann.build(np.arange(len(self.matrix)), self.matrix)
+
+    def query(self, vectors, num, exclude=None, batch_size=256):
+        """
+        The num nearest rows to each of vectors, as lists of (word, similarity)
+
+        exclude optionally holds one row per vector to leave out, e.g. the
+        query word itself (-1 for none).
+        """
+        vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        exclude = np.full(len(vectors), -1) if exclude is None else np.asarray(exclude).reshape(-1)
+        results = []
+        for start in range(0, len(vectors), batch_size):
+            batch = vectors[start:start + batch_size]
+            if self.ann is not None:
+                for vector, skip in zip(batch, exclude[start:start + batch_size]):
+                    rows = self.ann.search(vector, num + 1)
+                    results.append(self._top(rows, self.matrix[rows] @ vector, num, skip))
+                continue
+            scores = batch @ self.matrix.T
+            rows = np.arange(len(self.matrix))
+            for row_scores, skip in zip(scores, exclude[start:start + batch_size]):
+                results.append(self._top(rows, row_scores, num, skip))
+        return results
+
+    def _top(self, rows, scores, num, skip):
+        keep = rows != skip
+        rows = rows[keep]
+        scores = scores[keep]
+        if len(scores) > num:
+            top = np.argpartition(-scores, num - 1)[:num]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(self.words[row], float(score)) for row, score in zip(rows[top], scores[top])]
+
+    def neighbours(self, words, num):
+        """The num nearest neighbours of each of words (all must be in the vocabulary)"""
+        rows = np.array([self.vocab[w] for w in words], dtype=np.int64)
+        return self.query(self.matrix[rows], num, exclude=rows)
+
+def as_neighbour_index(model, vocab):
+    """model itself if it already is a NeighbourIndex, otherwise a new one over model"""
+    if isinstance(model, NeighbourIndex):
+        return model
+    return NeighbourIndex(model, vocab)
+
 def nns(word, num, model, vocab):
-    matrix = np.asmatrix(model)
-    v = model[vocab[word][0]].reshape(1, -1)
-    nns = st.distance.cdist(matrix, v, 'cosine').reshape(-1)
-    indices = [i for i in sorted(enumerate(nns), key=lambda x:x[1])]
-    cnt = 1
-    while cnt <= num:
-        ele = [key for (key,value) in vocab.items() if value[0] == indices[cnt][0]]
-        print(ele[0] + ' ' + str(1 - indices[cnt][1]))
-        cnt += 1
+    """Print the num nearest neighbours of word; model may also be a prebuilt NeighbourIndex"""
+    for ele, similarity in nns_return(word, num, model, vocab):
+        print(ele + ' ' + str(similarity))
 
 def nns_return(word, num, model, vocab, sims=True):
     '''
     Return the num nearest neighbors to word in model. 
     vocab holds the vocabulary dictionary.
+    Pass a NeighbourIndex as model to avoid normalising the model on every call.
     '''
-    matrix = np.asmatrix(model)
-    v = model[vocab[word][0]].reshape(1, -1)
-    nns = st.distance.cdist(matrix, v, 'cosine').reshape(-1)
-    indices = [i for i in sorted(enumerate(nns), key=lambda x:x[1])]
-    cnt = 1
-    ret = []
-    while cnt <= num:
-        ele = [key for (key,value) in vocab.items() if value[0] == indices[cnt][0]]
-        if sims:
-            ret.append([ele[0], (1 - indices[cnt][1])])
-        else:
-            ret.append(ele[0])
-        cnt += 1
-    return ret
+    ret = as_neighbour_index(model, vocab).neighbours([word], num)[0]
+    if sims:
+        return [[ele, similarity] for ele, similarity in ret]
+    return [ele for ele, similarity in ret]
 
 def synt_nns(word, num, rot, synt_matrix, model, vocab):
     '''
-    Return the num nearest syntagmatic neighbors to word.
-    synt_matrix holds the random index vectors, model holds the distributional vectors, and vocab holds the vocabulary dictionary.
+    Print the num nearest syntagmatic neighbors to word.
+    synt_matrix holds the random index vectors (or a NeighbourIndex over them), model holds the distributional vectors, and vocab holds the vocabulary dictionary.
     '''
-    v = np.roll(model[get_index(word, vocab)].reshape(1, -1),-rot)
-    nns = st.distance.cdist(synt_matrix, v, 'cosine').reshape(-1)
-    indices = [i for i in sorted(enumerate(nns), key=lambda x:x[1])]
-    cnt = 1
-    while cnt <= num:
-        ele = [key for (key,value) in vocab.items() if value[0] == indices[cnt][0]]
-        print(ele[0] + ' ' + str(1 - indices[cnt][1]))
-        cnt += 1
+    index = get_index(word, vocab)
+    v = np.roll(np.asarray(model[index]).reshape(-1), -rot)
+    # Like the original, skip the best hit rather than the word's own row
+    for ele, similarity in as_neighbour_index(synt_matrix, vocab).query(v, num + 1)[0][1:]:
+        print(ele + ' ' + str(similarity))
 
 ####################################
 # Evaluation
@@ -0,0 +1,283 @@
+import os
+import json
+import struct
+import numpy as np
+
+# Log record header: row, count and byte length of the word
+RECORD_HEADER = struct.Struct('<qqi')
+
+class VocabularyStore:
+    """RI word vocabulary: words, occurrence counts and float32 word vectors.
+
+    The compacted vocabulary is four flat files that are mapped, not
+    unpickled, on load. Edits are appended to a log as whole records (row,
+    count, word, vector) of the words they touched, so save() writes only
+    those words. Replaying a record twice is harmless. Directory layout:
+
+        meta.json            dimension, rows and generation of the files below
+        words.<gen>.bin      UTF-8 string pool of every word, in row order
+        offsets.<gen>.i64    rows + 1 offsets into the string pool
+        counts.<gen>.i64     occurrence count of every word
+        vectors.<gen>.f32    one float32 vector per word
+        log.<gen>.bin        records written since the last compaction
+
+    compact() writes the next generation and switches meta.json to it, so
+    readers see either the old files and log or the new ones. A read_only
+    store never writes; until its writer has created meta.json it is empty.
+    """
+
+    def __init__(self, directory, dimension, compact_ratio=0.5, compact_min_bytes=1 << 20, read_only=False):
+        self.directory = directory
+        self.dimension = int(dimension)
+        # The log is compacted once it is this large compared with the vectors
+        self.compact_ratio = compact_ratio
+        self.compact_min_bytes = compact_min_bytes
+        self.read_only = read_only
+        if not read_only:
+            os.makedirs(directory, exist_ok=True)
+            if not os.path.exists(self._path('meta.json')):
+                self._write_meta(0, 0)
+        self._meta_mtime = None
+        self.refresh()
+
+    def _path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def _file(self, name, generation=None):
+        extension = {'words': 'bin', 'offsets': 'i64', 'counts': 'i64', 'vectors': 'f32', 'log': 'bin'}[name]
+        return self._path(f"{name}.{self.generation if generation is None else generation}.{extension}")
+
+    def _write_meta(self, generation, rows):
+        with open(self._path('meta.json.tmp'), 'w') as f:
+            json.dump({'dimension': self.dimension, 'rows': rows, 'generation': generation}, f)
+        os.replace(self._path('meta.json.tmp'), self._path('meta.json'))
+
+    def _log_size(self):
+        try:
+            return os.stat(self._file('log')).st_size
+        except FileNotFoundError:
+            return 0
+
+    def refresh(self):
+        """Pick up records another process saved. Returns True if anything changed."""
+        try:
+            meta_mtime = os.stat(self._path('meta.json')).st_mtime_ns
+        except FileNotFoundError:
+            # Read-only, and not created yet
+            meta_mtime = 0
+        if meta_mtime != self._meta_mtime:
+            self._load()
+            self._meta_mtime = meta_mtime
+            return True
+        size = self._log_size()
+        if size < self._log_bytes:
+            self._load()
+            return True
+        if size > self._log_bytes:
+            self._replay()
+            return True
+        return False
+
+    def _load(self):
+        try:
+            with open(self._path('meta.json'), 'r') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            meta = {'dimension': self.dimension, 'rows': 0, 'generation': 0}
+        if meta['dimension'] != self.dimension:
+            raise ValueError(f"Vocabulary at '{self.directory}' has dimension {meta['dimension']}, expected {self.dimension}")
+        self.generation = meta['generation']
+        rows = meta['rows']
+        if rows:
+            offsets = np.fromfile(self._file('offsets'), dtype=np.int64).tolist()
+            with open(self._file('words'), 'rb') as f:
+                pool = f.read()
+            self.words = [pool[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(rows)]
+            counts = np.fromfile(self._file('counts'), dtype=np.int64)
+            # Copy-on-write, so updated rows cost memory but never touch the file
+            self._base = np.memmap(self._file('vectors'), dtype=np.float32, mode='c', shape=(rows, self.dimension))
+        else:
+            self.words = []
+            counts = np.zeros(0, dtype=np.int64)
+            self._base = np.zeros((0, self.dimension), dtype=np.float32)
+        self.rows = {word: row for row, word in enumerate(self.words)}
+        self._counts = np.zeros(max(16, 2 * rows), dtype=np.int64)
+        self._counts[:rows] = counts
+        # Words added since the last compaction
+        self._tail = np.zeros((16, self.dimension), dtype=np.float32)
+        self._dirty = set()
+        self._log_bytes = 0
+        self._replay()
+
+    def _replay(self):
+        """Apply the complete log records after the ones already applied"""
+        try:
+            with open(self._file('log'), 'rb') as f:
+                f.seek(self._log_bytes)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        vector_bytes = 4 * self.dimension
+        position = 0
+        while position + RECORD_HEADER.size <= len(data):
+            row, count, length = RECORD_HEADER.unpack_from(data, position)
+            end = position + RECORD_HEADER.size + length + vector_bytes
+            if end > len(data) or row > len(self):
+                # Partial record left by an interrupted save
+                break
+            word = data[position + RECORD_HEADER.size:end - vector_bytes].decode('utf-8')
+            if row == len(self):
+                self._append_word(word)
+            self._counts[row] = count
+            self._vector(row)[:] = np.frombuffer(data, dtype=np.float32, count=self.dimension, offset=end - vector_bytes)
+            position = end
+        self._log_bytes += position
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.rows
+
+    @property
+    def version(self):
+        """Changes whenever the vocabulary saved on disk changes"""
+        return f"{self.generation}.{self._log_bytes}"
+
+    def _vector(self, row):
+        base_rows = len(self._base)
+        return self._base[row] if row < base_rows else self._tail[row - base_rows]
+
+    def _append_word(self, word):
+        row = len(self.words)
+        tail_row = row - len(self._base)
+        if tail_row >= len(self._tail):
+            self._tail = np.concatenate([self._tail, np.zeros_like(self._tail)])
+        if row >= len(self._counts):
+            self._counts = np.concatenate([self._counts, np.zeros_like(self._counts)])
+        self.words.append(word)
+        self.rows[word] = row
+        self._counts[row] = 0
+        return row
+
+    def vector(self, word):
+        """Vector of word, or None if it is not in the vocabulary"""
+        row = self.rows.get(word)
+        return None if row is None else self._vector(row)
+
+    def count(self, row):
+        return int(self._counts[row])
+
+    def counts(self, rows):
+        return self._counts[np.asarray(rows, dtype=np.int64)]
+
+    def touch(self, word, occurrences=1):
+        """Count occurrences more (or fewer, if negative) of word, adding it if new. Returns its row."""
+        row = self.rows.get(word)
+        if row is None:
+            row = self._append_word(word)
+        self._counts[row] += occurrences
+        self._dirty.add(row)
+        return row
+
+    def add_to(self, row, columns, values):
+        """Add values at columns of the vector of row"""
+        np.add.at(self._vector(row), columns, values)
+        self._dirty.add(row)
+
+    def touch_many(self, words, occurrences):
+        """touch() every word in order with its number of occurrences. Returns their rows."""
+        rows = np.array([self.rows[word] if word in self.rows else self._append_word(word) for word in words], dtype=np.int64)
+        np.add.at(self._counts, rows, np.asarray(occurrences, dtype=np.int64))
+        self._dirty.update(rows.tolist())
+        return rows
+
+    def add_to_rows(self, rows, columns, values):
+        """Add values[i] at columns[i] of the vector of rows[i], for every i"""
+        rows = np.asarray(rows, dtype=np.int64)
+        in_base = rows < len(self._base)
+        for matrix, selected, first in [(self._base, in_base, 0), (self._tail, ~in_base, len(self._base))]:
+            if selected.any():
+                np.add.at(matrix, (rows[selected, None] - first, np.asarray(columns)[selected]), np.asarray(values)[selected])
+        self._dirty.update(rows.tolist())
+
+    def vectors(self, rows):
+        """(len(rows), dimension) float32 array of the vectors of rows"""
+        rows = np.asarray(rows, dtype=np.int64)
+        result = np.empty((len(rows), self.dimension), dtype=np.float32)
+        in_base = rows < len(self._base)
+        result[in_base] = self._base[rows[in_base]]
+        result[~in_base] = self._tail[rows[~in_base] - len(self._base)]
+        return result
+
+    def matrix(self):
+        """(rows, dimension) float32 array of every word vector"""
+        return np.concatenate([self._base, self._tail[:len(self) - len(self._base)]])
+
+    def save(self):
+        """Append the words touched since the last save to the log, compacting it when large"""
+        if self.read_only:
+            raise RuntimeError(f"Vocabulary at '{self.directory}' was opened read-only")
+        if not self._dirty:
+            return
+        records = []
+        for row in sorted(self._dirty):
+            word = self.words[row].encode('utf-8')
+            records.append(RECORD_HEADER.pack(row, self._counts[row], len(word)))
+            records.append(word)
+            records.append(np.ascontiguousarray(self._vector(row), dtype=np.float32).tobytes())
+        data = b''.join(records)
+        # Writing at the expected offset (and truncating) discards a partial record left by an interrupted save
+        path = self._file('log')
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+            f.seek(self._log_bytes)
+            f.write(data)
+            f.truncate()
+        self._log_bytes += len(data)
+        self._dirty.clear()
+        if self._log_bytes > max(self.compact_min_bytes, self.compact_ratio * len(self) * 4 * self.dimension):
+            self.compact()
+
+    def compact(self):
+        """Fold the log and unsaved changes into a new generation of the flat files"""
+        if self.read_only:
+            raise RuntimeError(f"Vocabulary at '{self.directory}' was opened read-only")
+        generation = self.generation + 1
+        encoded = [word.encode('utf-8') for word in self.words]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(word) for word in encoded], out=offsets[1:])
+        with open(self._file('words', generation), 'wb') as f:
+            f.write(b''.join(encoded))
+        offsets.tofile(self._file('offsets', generation))
+        self._counts[:len(self)].tofile(self._file('counts', generation))
+        with open(self._file('vectors', generation), 'wb') as f:
+            for start in range(0, len(self._base), 65536):
+                f.write(np.ascontiguousarray(self._base[start:start + 65536]).tobytes())
+            f.write(self._tail[:len(self) - len(self._base)].tobytes())
+        self._write_meta(generation, len(self))
+
+        old_generation = self.generation
+        self._base = None
+        self._meta_mtime = None
+        self.refresh()
+        for name in ('words', 'offsets', 'counts', 'vectors', 'log'):
+            try:
+                os.remove(self._file(name, old_generation))
+            except FileNotFoundError:
+                pass
+        print(f"Compacted vocabulary of {len(self)} words in {self.directory}")
+
+def import_legacy_vocabulary(store, path):
+    """Copy a pickled vocab.npz (vocab dict and vectors) into an empty store"""
+    if len(store) or not os.path.exists(path):
+        return 0
+    data = np.load(path, allow_pickle=True)
+    vocab = data['vocab'].item()
+    vectors = data['vectors']
+    for word, (legacy_row, count) in sorted(vocab.items(), key=lambda item: item[1][0]):
+        row = store._append_word(word)
+        store._counts[row] = count
+        store._vector(row)[:] = vectors[legacy_row]
+    store.compact()
+    print(f"Imported {len(vocab)} legacy vocabulary words into {store.directory}")
+    return len(vocab)
@@ -2,99 +2,275 @@
 import numpy as np
 import scipy.spatial as st
 from time import gmtime, strftime
-from ri import dsm, make_index, weight_func, remove_centroid, get_vec, get_index
+from ri import dsm, make_index, weight_func, remove_centroid, get_vec, get_index, RIModel
 import os
+import json
+import hashlib
 from pathlib import Path
 
 class WordPredictAPI:
-    def __init__(self, dimension=2000, window_size=4, nonzeros=8, delta=60):
+    def __init__(self, dimension=2000, window_size=4, nonzeros=8, delta=60, checkpoint_path=None):
+        """Next-word predictor trained with Random Indexing over the notes
+
+        Training is incremental: the RI model and the sentences already
+        trained from every note are kept, so train() only processes what was
+        added to the notes since the last call. With checkpoint_path (.npz)
+        that state is saved after training and resumed by the next process.
+        """
         self.dimension = dimension
         self.window_size = window_size
         self.nonzeros = nonzeros
         self.delta = delta
+        self.checkpoint_path = checkpoint_path
+        self.model = None
         self.distvecs = None
         self.rivecs = None
         self.vocab = None
-        
+        self.notes_stamp = None
+
+    def _new_model(self):
+        return RIModel(self.dimension, self.nonzeros, 'legacy', win=self.window_size,
+                       trainfunc='direction', delta=self.delta, use_weights=True)
+
     def train(self, notes_directory):
         """Train the model using notes from directory"""
-        # Collect all sentences from notes
-        all_sentences = []
-        
-        # Read all .txt files from the notes directory
-        for filename in os.listdir(notes_directory):
+        notes = self._read_notes(notes_directory)
+        if not any(notes.values()):
+            raise ValueError("No training data found in notes directory")
+
+        if self.model is None:
+            if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+                self.model = RIModel.resume(self.checkpoint_path)
+            else:
+                self.model = self._new_model()
+
+        new_sentences = self._new_sentences(notes)
+        if new_sentences is None:
+            # A note was rewritten or deleted; RI cannot forget, so start over
+            print("Notes changed since the last training, retraining from scratch")
+            self.model = self._new_model()
+            new_sentences = self._new_sentences(notes)
+        tokens = self.model.partial_fit(new_sentences)
+        self.model.meta['notes'] = {
+            filename: [len(sentences), self._digest(sentences)]
+            for filename, sentences in notes.items()
+        }
+        print(f"Trained on {len(new_sentences)} new sentences ({tokens} tokens)")
+        if self.checkpoint_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.checkpoint_path)), exist_ok=True)
+            self.model.checkpoint(self.checkpoint_path)
+
+        self.vocab = self.model.legacy_vocab()
+        self.rivecs = self.model.rivecs
+        # Remove centroid from a copy, the model keeps the raw vectors for further training
+        self.distvecs = np.array(self.model.distvecs)
+        remove_centroid(self.distvecs)
+        self.notes_stamp = self._notes_stamp(notes_directory)
+        self._prepare()
+
+    def save(self, path):
+        """Save the trained model into directory path for load().
+
+        Vectors are a raw float32 file and the vocabulary a UTF-8 string pool
+        with offsets and frequencies, so load() can map them instead of
+        unpickling. meta.json is written last.
+        """
+        if self.vocab is None:
+            raise ValueError("Nothing to save, train the model first")
+        os.makedirs(path, exist_ok=True)
+        encoded = [word.encode('utf-8') for word in self.words]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(word) for word in encoded], out=offsets[1:])
+        freqs = np.zeros(len(self.vocab), dtype=np.int64)
+        for word, (idx, freq) in self.vocab.items():
+            freqs[idx] = freq
+
+        def replace(filename, write):
+            with open(os.path.join(path, filename + '.tmp'), 'wb') as f:
+                write(f)
+            os.replace(os.path.join(path, filename + '.tmp'), os.path.join(path, filename))
+
+        replace('vectors.f32', lambda f: f.write(np.ascontiguousarray(self.distvecs, dtype=np.float32).tobytes()))
+        replace('words.bin', lambda f: f.write(b''.join(encoded)))
+        for filename, array in [('norms.npy', self.norms), ('offsets.npy', offsets), ('freqs.npy', freqs),
+                                ('rivecs.npy', np.asarray(self.rivecs, dtype=np.int32))]:
+            replace(filename, lambda f: np.save(f, array))
+        meta = {
+            'rows': len(self.vocab),
+            'dimension': self.dimension,
+            'window_size': self.window_size,
+            'nonzeros': self.nonzeros,
+            'delta': self.delta,
+            'notes_stamp': self.notes_stamp
+        }
+        replace('meta.json', lambda f: f.write(json.dumps(meta).encode('utf-8')))
+
+    def load(self, path, mmap=True):
+        """Load a model saved with save(); with mmap the vectors are memory-mapped read-only"""
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        rows = meta['rows']
+        self.dimension = meta['dimension']
+        self.window_size = meta['window_size']
+        self.nonzeros = meta['nonzeros']
+        self.delta = meta['delta']
+        self.notes_stamp = meta['notes_stamp']
+
+        vectors_path = os.path.join(path, 'vectors.f32')
+        if mmap and rows:
+            self.distvecs = np.memmap(vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dimension))
+        else:
+            self.distvecs = np.fromfile(vectors_path, dtype=np.float32).reshape(rows, self.dimension)
+        offsets = np.load(os.path.join(path, 'offsets.npy'))
+        freqs = np.load(os.path.join(path, 'freqs.npy'))
+        with open(os.path.join(path, 'words.bin'), 'rb') as f:
+            pool = f.read()
+        self.vocab = {
+            pool[offsets[i]:offsets[i + 1]].decode('utf-8'): [i, int(freqs[i])]
+            for i in range(rows)
+        }
+        self.rivecs = np.load(os.path.join(path, 'rivecs.npy'))
+        self._prepare(np.load(os.path.join(path, 'norms.npy')))
+        return self
+
+    def _notes_stamp(self, notes_directory):
+        """Digest of the names, sizes and modification times of the notes"""
+        entries = []
+        for filename in sorted(os.listdir(notes_directory)):
+            if filename.endswith('.txt'):
+                stat = os.stat(os.path.join(notes_directory, filename))
+                entries.append(f"{filename}:{stat.st_size}:{stat.st_mtime_ns}")
+        return hashlib.sha1('\n'.join(entries).encode('utf-8')).hexdigest()
+
+    def is_stale(self, notes_directory):
+        """True if the notes changed since the model was trained"""
+        return self.notes_stamp != self._notes_stamp(notes_directory)
+
+    def load_or_train(self, notes_directory, path):
+        """Load the model saved at path, retraining and saving it first if the notes changed.
+
+        Returns True if it was (re)trained.
+        """
+        if os.path.exists(os.path.join(path, 'meta.json')):
+            self.load(path)
+            if not self.is_stale(notes_directory):
+                return False
+        self.train(notes_directory)
+        self.save(path)
+        return True
+
+    def _prepare(self, norms=None):
+        """Precompute what predict_next_words needs from distvecs, rivecs and vocab.
+
+        distvecs itself is only read, so a memory-mapped model stays shared.
+        """
+        if norms is None:
+            norms = np.linalg.norm(np.asarray(self.distvecs, dtype=np.float32), axis=1)
+        self.norms = np.asarray(norms, dtype=np.float32)
+        # Words without a vector have no cosine similarity and are never predicted
+        self.valid = self.norms > 0
+        self.words = np.empty(len(self.vocab), dtype=object)
+        freqs = np.zeros(len(self.vocab))
+        for word, (idx, freq) in self.vocab.items():
+            self.words[idx] = word
+            freqs[idx] = freq
+        self.weights = np.exp(-self.delta * (freqs / len(self.vocab))).astype(np.float32)
+
+        # Random indices for directional scoring, permuted like 'direction' training does for right neighbours
+        self.ri_columns = None
+        if self.rivecs is not None and len(self.rivecs):
+            rivecs = np.asarray(self.rivecs)
+            self.ri_columns = (rivecs[:, :, 0] + 1) % self.dimension
+            self.ri_signs = rivecs[:, :, 1].astype(np.float32)
+            # Repeated positions add up, so norms count every pair of equal positions
+            same = self.ri_columns[:, :, None] == self.ri_columns[:, None, :]
+            self.ri_norms = np.sqrt(np.einsum('vk,vl,vkl->v', self.ri_signs, self.ri_signs, same))
+
+    def _read_notes(self, notes_directory):
+        """Sentences of every .txt file in notes_directory"""
+        notes = {}
+        for filename in sorted(os.listdir(notes_directory)):
             if filename.endswith('.txt'):
                 file_path = os.path.join(notes_directory, filename)
                 try:
                     with open(file_path, 'r', encoding='utf-8') as f:
                         text = f.read()
                         # Split text into sentences (you might want to improve this splitting)
-                        sentences = [s.strip() for s in text.split('.') if s.strip()]
-                        all_sentences.extend(sentences)
+                        notes[filename] = [s.strip() for s in text.split('.') if s.strip()]
                 except Exception as e:
                     print(f"Error reading file {filename}: {str(e)}")
-        
-        if not all_sentences:
-            raise ValueError("No training data found in notes directory")
-            
-        # Write sentences to temporary file for dsm function
-        with open("temp_training.txt", "w", encoding='utf-8') as f:
-            for sentence in all_sentences:
-                f.write(f"{sentence.strip()}\n")
-        
-        # Use dsm function for Random Indexing
-        self.distvecs, self.rivecs, self.vocab = dsm(
-            infile="temp_training.txt",
-            win=self.window_size,
-            trainfunc='direction',
-            indexfunc='legacy',
-            dimen=self.dimension,
-            nonzeros=self.nonzeros,
-            delta=self.delta,
-            use_weights=True
-        )
-        
-        # Remove centroid
-        remove_centroid(self.distvecs)
-        
-        # Clean up temporary file
-        try:
-            os.remove("temp_training.txt")
-        except:
-            pass
+        return notes
+
+    def _digest(self, sentences):
+        return hashlib.sha1('\n'.join(sentences).encode('utf-8')).hexdigest()
+
+    def _new_sentences(self, notes):
+        """Sentences not trained yet, or None if a trained note changed other than by appending"""
+        trained = self.model.meta.get('notes', {})
+        if any(filename not in notes for filename in trained):
+            return None
+        new_sentences = []
+        for filename, sentences in notes.items():
+            count, digest = trained.get(filename, [0, self._digest([])])
+            if count > len(sentences) or self._digest(sentences[:count]) != digest:
+                return None
+            new_sentences.extend(sentences[count:])
+        return new_sentences
     
-    def predict_next_word(self, context, top_k=5):
+    def predict_next_word(self, context, top_k=5, directional=False):
         """Predict next words based on context"""
-        if not self.vocab or not self.distvecs:
-            return []
-            
-        context_words = context.strip().split()
-        if not context_words:
-            return []
-        
-        # Get context embedding
-        context_vec = np.zeros(self.dimension)
-        for word in context_words[-self.window_size:]:
-            if word in self.vocab:
-                word_vec = get_vec(word, self.vocab, self.distvecs)
-                if word_vec is not False:
-                    context_vec = np.add(context_vec, word_vec)
-        
-        # Ensure context_vec is 1-D
-        context_vec = np.ravel(context_vec)
-        
-        # Calculate similarities
-        similarities = []
-        for word, (idx, freq) in self.vocab.items():
-            if word not in context_words[-1:]:
-                word_vec = get_vec(word, self.vocab, self.distvecs)
-                if word_vec is not False:
-                    word_vec = np.ravel(word_vec)
-                    sim = 1 - st.distance.cosine(context_vec, word_vec)
-                    if not np.isnan(sim):
-                        weight = weight_func(freq, len(self.vocab), self.delta)
-                        similarities.append((word, sim * weight))
-        
-        # Sort by weighted similarity
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        return similarities[:top_k]
\ No newline at end of file
+        return self.predict_next_words([context], top_k, directional)[0]
+
+    def predict_next_words(self, contexts, top_k=5, directional=False):
+        """Predict next words for many contexts at once.
+
+        The vectors of the last window_size context words are summed and every
+        other word is scored by its cosine similarity to that sum, times its
+        frequency weight. With directional the sum is compared with the
+        candidates' permuted random indices instead (like ri.synt_sim), which
+        favours words seen to the right of the context words.
+        Returns one list of (word, score) pairs per context.
+        """
+        if not self.vocab or self.distvecs is None:
+            return [[] for _ in contexts]
+        if directional and self.ri_columns is None:
+            raise ValueError("Directional prediction needs the random index vectors")
+
+        context_vecs = np.zeros((len(contexts), self.distvecs.shape[1]), dtype=np.float32)
+        last_rows = np.full(len(contexts), -1)
+        for i, context in enumerate(contexts):
+            context_words = context.strip().split()
+            rows = [self.vocab[word][0] for word in context_words[-self.window_size:] if word in self.vocab]
+            if rows:
+                context_vecs[i] = np.asarray(self.distvecs[rows], dtype=np.float32).sum(axis=0)
+            if context_words and context_words[-1] in self.vocab:
+                last_rows[i] = self.vocab[context_words[-1]][0]
+        norms = np.linalg.norm(context_vecs, axis=1, keepdims=True)
+        np.divide(context_vecs, norms, out=context_vecs, where=norms > 0)
+
+        if directional:
+            gathered = np.einsum('bvk,vk->bv', context_vecs[:, self.ri_columns], self.ri_signs)
+            scores = gathered / np.where(self.ri_norms > 0, self.ri_norms, 1)
+            valid = self.ri_norms > 0
+        else:
+            scores = (context_vecs @ self.distvecs.T) / np.where(self.valid, self.norms, 1)
+            valid = self.valid
+        scores *= self.weights
+        scores[:, ~valid] = -np.inf
+
+        results = []
+        for i in range(len(contexts)):
+            if norms[i, 0] == 0:
+                results.append([])
+                continue
+            row_scores = scores[i]
+            if last_rows[i] >= 0:
+                row_scores[last_rows[i]] = -np.inf
+            k = min(top_k, int(np.isfinite(row_scores).sum()))
+            if k <= 0:
+                results.append([])
+                continue
+            top = np.argpartition(-row_scores, k - 1)[:k]
+            top = top[np.argsort(-row_scores[top], kind='stable')]
+            results.append([(self.words[row], float(row_scores[row])) for row in top])
+        return results
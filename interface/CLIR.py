@@ -16,11 +16,7 @@ sys.path.append(str(api_dir))
 from indexerAPI import IndexerAPI
 from retrievalAPI import RetrievalAPI
 from wordPredictAPI import WordPredictAPI
-
-# Initialize the APIs
-indexer = IndexerAPI()
-retriever = RetrievalAPI()
-predictor = WordPredictAPI()
+from embeddingStore import EmbeddingStore
 
 # Ensure data directories exist
 notes_dir = current_dir/ 'data' / 'notes'
@@ -34,6 +30,32 @@ embeddings_dir.mkdir(parents=True, exist_ok=True)
 os.environ['NOTES_DIRECTORY'] = str(notes_dir)
 os.environ['EMBEDDINGS_DIRECTORY'] = str(embeddings_dir)
 
+# The APIs are created on first use, so commands like list or show never load BERT.
+# IndexerAPI and RetrievalAPI share one encoder, loaded on the first embedding.
+_apis = {}
+
+def get_indexer():
+    if 'indexer' not in _apis:
+        _apis['indexer'] = IndexerAPI()
+    return _apis['indexer']
+
+def get_store():
+    """The note embedding store, opened read-only without building IndexerAPI; None if nothing was indexed yet"""
+    return EmbeddingStore.open(str(embeddings_dir / 'store'))
+
+def get_retriever():
+    if 'retriever' not in _apis:
+        _apis['retriever'] = RetrievalAPI()
+    return _apis['retriever']
+
+def get_predictor():
+    if 'predictor' not in _apis:
+        # Training state is checkpointed, so each run only trains on new note text
+        _apis['predictor'] = WordPredictAPI(checkpoint_path=str(embeddings_dir / 'predictor' / 'ri_checkpoint.npz'))
+    return _apis['predictor']
+
+predictor_model_dir = str(embeddings_dir / 'predictor' / 'model')
+
 @click.group()
 def cli():
     """Command-line interface for managing code-mixed Telugu-English notes."""
@@ -49,7 +71,7 @@ def create(filename):
         if note_path.exists():
             raise FileExistsError(f"Note '{filename}' already exists")
             
-        indexer.createNote(filename)
+        get_indexer().createNote(filename)
         click.echo(click.style(f"✓ Note '{filename}' created successfully.", fg='green'))
         click.echo(click.style(f"Note location: {note_path}", fg='blue'))
     except Exception as e:
@@ -69,33 +91,47 @@ def edit(filename ,text):
             click.echo(click.style("No changes made.", fg='yellow'))
             return
             
-        indexer.editNote(filename, text)
+        get_indexer().editNote(filename, text)
         click.echo(click.style(f"✓ Note '{filename}' updated successfully.", fg='green'))
     except Exception as e:
         click.echo(click.style(f"✗ Error: {str(e)}", fg='red'))
 
+@cli.command()
+@click.argument('paths', nargs=-1, required=True)
+@click.option('--batch-size', '-b', default=16, help='Notes per BERT forward pass')
+def bulk_index(paths, batch_size):
+    """Index every note in PATHS (directories or .txt files) in one pass."""
+    try:
+        indexed = get_indexer().bulk_index(paths, batch_size=batch_size)
+        click.echo(click.style(f"✓ Indexed {len(indexed)} notes.", fg='green'))
+    except Exception as e:
+        click.echo(click.style(f"✗ Error during bulk indexing: {str(e)}", fg='red'))
+
+@cli.command()
+def rebuild_index():
+    """Compact the embedding store and rebuild the ANN index."""
+    try:
+        get_indexer().rebuild_index()
+        click.echo(click.style("✓ Index rebuilt.", fg='green'))
+    except Exception as e:
+        click.echo(click.style(f"✗ Error rebuilding index: {str(e)}", fg='red'))
+
+@cli.command()
+@click.option('--dim', '-d', default=256, help='Dimensions to keep RI vectors in (0 for full size)')
+def reduce_ri(dim):
+    """Project stored RI vectors to fewer dimensions with a truncated SVD."""
+    try:
+        get_indexer().reduce_ri(dim or None)
+        click.echo(click.style("✓ RI vectors reduced." if dim else "✓ RI vectors restored to full size.", fg='green'))
+    except Exception as e:
+        click.echo(click.style(f"✗ Error reducing RI vectors: {str(e)}", fg='red'))
+
 @cli.command()
 @click.argument('filename')
 def delete(filename):
     """Delete note FILENAME and its embeddings."""
     try:
-        note_path = notes_dir / f"{filename}.txt"
-        bert_emb_path = embeddings_dir / f"{filename}_bert.npy"
-        ri_emb_path = embeddings_dir / f"{filename}_ri.npy"
-        
-        # Delete files if they exist
-        files_deleted = False
-        if note_path.exists():
-            note_path.unlink()
-            files_deleted = True
-            
-        if bert_emb_path.exists():
-            bert_emb_path.unlink()
-            files_deleted = True
-            
-        if ri_emb_path.exists():
-            ri_emb_path.unlink()
-            files_deleted = True
+        files_deleted = get_indexer().deleteNote(filename)
             
         if files_deleted:
             click.echo(click.style(f"✓ Note '{filename}' and its embeddings deleted successfully.", fg='green'))
@@ -108,10 +144,12 @@ def delete(filename):
 @cli.command()
 @click.argument('query_text')
 @click.option('--top-k', '-k', default=3, help='Number of results to return')
-def search(query_text, top_k):
+@click.option('--keywords', is_flag=True, help='Rank by matching words (BM25) only, without loading BERT')
+def search(query_text, top_k, keywords):
     """Search notes using QUERY_TEXT."""
     try:
-        results = retriever.find(query_text)
+        retriever = get_retriever()
+        results = retriever.find_keywords(query_text, top_k) if keywords else retriever.find(query_text, top_k)
         
         if not results:
             click.echo(click.style("No matching documents found.", fg='yellow'))
@@ -141,8 +179,9 @@ def search(query_text, top_k):
 
 from datetime import datetime
 
-@cli.command()
-def list():
+# Named list_notes so the builtin list stays usable in this module
+@cli.command(name='list')
+def list_notes():
     """List all available notes."""
     try:
         # Ensure directory exists
@@ -159,6 +198,7 @@ def list():
 
         click.echo(click.style("\nAvailable Notes:", fg='blue'))
         click.echo("=" * 40)
+        store = get_store()
         
         for idx, note_path in enumerate(sorted(notes), 1):
             # Get note information
@@ -167,9 +207,7 @@ def list():
             last_modified_str = last_modified.strftime("%Y-%m-%d %H:%M:%S")
             
             # Check if embeddings exist
-            bert_emb = embeddings_dir / f"{note_path.stem}_bert.npy"
-            ri_emb = embeddings_dir / f"{note_path.stem}_ri.npy"
-            has_embeddings = bert_emb.exists() and ri_emb.exists()
+            has_embeddings = store is not None and note_path.stem in store
             
             # Format output
             click.echo(
@@ -241,11 +279,17 @@ def debug():
     click.echo(click.style("Embeddings Directory Exists: ", fg='green') + 
               click.style(str(embeddings_dir.exists()), fg='white'))
     
-    if embeddings_dir.exists():
-        embeddings = list(embeddings_dir.glob('*.npy'))
-        click.echo(click.style("\nFound Embeddings:", fg='blue'))
-        for emb in embeddings:
-            click.echo(click.style(f"- {emb.name}", fg='white'))
+    store = get_store() if embeddings_dir.exists() else None
+    if store is None:
+        click.echo(click.style("\nEmbedding Store: ", fg='green') + click.style("none yet", fg='yellow'))
+    else:
+        click.echo(click.style("\nEmbedding Store: ", fg='green') + 
+                  click.style(store.directory, fg='white'))
+        click.echo(click.style("Rows (live / total): ", fg='green') + 
+                  click.style(f"{int(store.live_mask().sum())} / {len(store)}", fg='white'))
+        click.echo(click.style("\nIndexed Notes:", fg='blue'))
+        for note_id in sorted(store.note_ids()):
+            click.echo(click.style(f"- {note_id}", fg='white'))
 
 @cli.command()
 def check_notes():
@@ -277,15 +321,17 @@ def check_notes():
 @cli.command()
 @click.argument('context')
 @click.option('--top-k', '-k', default=3, help='Number of predictions to return')
-def predict(context, top_k):
+@click.option('--directional', is_flag=True, help='Score words by what followed the context in the notes')
+def predict(context, top_k, directional):
     """Predict next words based on context."""
     try:
-        # Train the model if not already trained
-        if predictor.vocab is None:
-            click.echo(click.style("Training word prediction model...", fg='yellow'))
-            predictor.train(notes_dir)
+        predictor = get_predictor()
+        # Map the saved model, training it first if the notes changed since it was saved
+        if predictor.vocab is None or predictor.is_stale(notes_dir):
+            if predictor.load_or_train(notes_dir, predictor_model_dir):
+                click.echo(click.style("Word prediction model trained on the changed notes.", fg='yellow'))
         
-        predictions = predictor.predict_next_word(context, top_k)
+        predictions = predictor.predict_next_word(context, top_k, directional)
         
         if not predictions:
             click.echo(click.style("No predictions available.", fg='yellow'))
@@ -307,7 +353,9 @@ def train_predictor():
     """Retrain the word prediction model."""
     try:
         click.echo(click.style("Training word prediction model...", fg='yellow'))
+        predictor = get_predictor()
         predictor.train(notes_dir)
+        predictor.save(predictor_model_dir)
         click.echo(click.style("✓ Word prediction model trained successfully.", fg='green'))
     except Exception as e:
         click.echo(click.style(f"✗ Error during training: {str(e)}", fg='red'))
@@ -57,18 +57,12 @@ def main():
                 print(f"Successfully indexed note: {note_id}")
                 
                 # Verify embeddings
-                bert_path = os.path.join(indexer.EMBEDDINGS_DIRECTORY, f"{note_id}_bert.npy")
-                en_path = os.path.join(indexer.VEC_EN_DIR, f"{note_id}_ri.npy")
-                te_path = os.path.join(indexer.VEC_TE_DIR, f"{note_id}_ri.npy")
-                
-                if all(os.path.exists(p) for p in [bert_path, en_path, te_path]):
-                    bert_emb = np.load(bert_path)
-                    en_emb = np.load(en_path)
-                    te_emb = np.load(te_path)
+                if note_id in indexer.store:
+                    row = indexer.store.rows_for(note_id)[0]
                     print(f"Embeddings verified for {note_id}:")
-                    print(f"BERT shape: {bert_emb.shape}")
-                    print(f"English RI shape: {en_emb.shape}")
-                    print(f"Telugu RI shape: {te_emb.shape}")
+                    print(f"BERT shape: {indexer.store.matrix('bert')[row].shape}")
+                    print(f"English RI shape: {indexer.store.matrix('ri_en')[row].shape}")
+                    print(f"Telugu RI shape: {indexer.store.matrix('ri_te')[row].shape}")
                 else:
                     print(f"Warning: Some embeddings missing for {note_id}")
                     